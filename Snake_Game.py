@@ -1,12 +1,23 @@
+import time
+IMPORT_STARTED = time.perf_counter()  # Start of the startup report
+
 import pygame
+import argparse
+import csv
+import itertools
+import os
 import sys
 import random
 import math
-import time
-from pygame import gfxdraw
-
-# Initialize pygame
-pygame.init()
+import numpy as np
+from collections import OrderedDict
+from functools import cached_property
+from snake_engine import (
+    Settings, SnakeEngine, Renderer, ScaledClock, InputQueue, TICK_RATE, MAX_CATCH_UP_TICKS,
+    RAMP_STEPS, COLOR_RAMPS, OBSTACLE, SNAKE_CELL, board_size,
+)
+from snake_replay import Replay, ReplayRecorder, ReplayPlayer
+from snake_autopilot import POLICIES
 
 # Constants
 WIDTH, HEIGHT = 800, 600
@@ -14,6 +25,13 @@ GRID_SIZE = 20
 GRID_WIDTH = WIDTH // GRID_SIZE
 GRID_HEIGHT = HEIGHT // GRID_SIZE
 FPS = 60
+STARTUP_BUDGET = 0.5  # Seconds from import to the first frame that --startup-report allows
+ANIMATED_THEMES = (2, 3)  # Space and Underwater redraw their whole background every frame
+HUD_RECT = pygame.Rect(0, 0, WIDTH, 2 * GRID_SIZE)  # Band the HUD text is drawn in
+DIRTY_CELL_LIMIT = GRID_WIDTH * GRID_HEIGHT // 4  # Past this many changed cells a full redraw is cheaper
+REPLAY_DIR = "replays"  # Finished games are saved here when settings.save_replays is on
+PROFILE_KEY = pygame.K_F3  # Toggles the frame profiler overlay
+PROFILE_EXPORT_KEY = pygame.K_F4  # Saves the profiler's samples as CSV
 
 # Colors
 BLACK = (0, 0, 0)
@@ -27,422 +45,336 @@ CYAN = (0, 255, 255)
 ORANGE = (255, 165, 0)
 GRAY = (128, 128, 128)
 
-# Create the screen
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Cosmic Snake Adventure")
-clock = pygame.time.Clock()
-
 # Game states
 MENU = 0
 PLAYING = 1
 GAME_OVER = 2
 SETTINGS = 3
 
-# Settings
-class Settings:
-    def __init__(self):
-        self.difficulty = 1  # 0: Easy, 1: Medium, 2: Hard
-        self.theme = 0  # 0: Classic, 1: Neon, 2: Space, 3: Underwater
-        self.snake_style = 0  # 0: Classic, 1: Gradient, 2: Patterned, 3: Glowing
-        self.special_foods = True
-        self.obstacles = True
-        self.grid_visible = True
-        self.particle_effects = True
-        self.background_motion = True
-        self.trail_effect = True
-
-    def get_speed(self):
-        speeds = [6, 10, 15]
-        return speeds[self.difficulty]
-
-    def get_theme_colors(self):
-        if self.theme == 0:  # Classic
-            return {
-                'background': (50, 50, 50),
-                'grid': (70, 70, 70),
-                'snake_head': (0, 200, 0),
-                'snake_body': (0, 255, 0),
-                'food': (255, 0, 0),
-                'special_food': (255, 215, 0),
-                'obstacle': (128, 128, 128),
-                'text': (255, 255, 255),
-            }
-        elif self.theme == 1:  # Neon
-            return {
-                'background': (10, 10, 30),
-                'grid': (30, 30, 50),
-                'snake_head': (255, 0, 255),
-                'snake_body': (0, 255, 255),
-                'food': (255, 255, 0),
-                'special_food': (255, 128, 0),
-                'obstacle': (150, 0, 255),
-                'text': (0, 255, 255),
-            }
-        elif self.theme == 2:  # Space
-            return {
-                'background': (5, 5, 20),
-                'grid': (15, 15, 40),
-                'snake_head': (200, 200, 255),
-                'snake_body': (150, 150, 255),
-                'food': (255, 100, 100),
-                'special_food': (255, 200, 50),
-                'obstacle': (100, 50, 150),
-                'text': (200, 200, 255),
-            }
-        else:  # Underwater
-            return {
-                'background': (0, 50, 100),
-                'grid': (0, 70, 120),
-                'snake_head': (0, 255, 200),
-                'snake_body': (0, 200, 255),
-                'food': (255, 50, 50),
-                'special_food': (255, 200, 0),
-                'obstacle': (50, 100, 150),
-                'text': (200, 255, 255),
-            }
-
 settings = Settings()
 
-# Function to create a gradient effect
-def get_gradient_color(color1, color2, ratio):
-    return (
-        int(color1[0] * (1 - ratio) + color2[0] * ratio),
-        int(color1[1] * (1 - ratio) + color2[1] * ratio),
-        int(color1[2] * (1 - ratio) + color2[2] * ratio)
-    )
-
-# Particle system
-class Particle:
-    def __init__(self, x, y, color, velocity=None, size=None, lifespan=None):
-        self.x = x
-        self.y = y
-        self.color = color
-        self.velocity = velocity or [random.uniform(-2, 2), random.uniform(-2, 2)]
-        self.size = size or random.randint(2, 5)
-        self.lifespan = lifespan or random.randint(20, 40)
-        self.age = 0
+# Draws many circles of one color at once: each circle's pixels are stamped
+# into an alpha mask from a precomputed stencil, and the mask becomes the alpha
+# channel of a single color layer that is blitted in one go. The mask has a
+# margin of max_radius pixels on every side, so circles crossing the edge of
+# the surface are clipped instead of needing a bounds check per pixel.
+class CircleBatch:
+    def __init__(self, max_radius, outline=False):
+        self.max_radius = max_radius
+        self.outline = outline  # Draw 1 pixel wide rings instead of filled circles
+        self.size = None
+        self.alpha_mask = None
+        self.stencils = None
+        self.layers = {}  # color -> layer whose alpha is the mask
+
+    def resize(self, size):
+        if self.size == size:
+            return
 
-    def update(self):
-        self.x += self.velocity[0]
-        self.y += self.velocity[1]
-        self.age += 1
-        self.size = max(0, self.size - 0.1)
-        return self.age < self.lifespan and self.size > 0
+        margin = self.max_radius
+        width, height = size[0] + 2 * margin, size[1] + 2 * margin
+        self.alpha_mask = np.zeros(width * height, dtype=np.uint8)
+
+        # Pixel offsets of a circle of each radius, in flat [x][y] mask indices
+        self.stencils = []
+        for radius in range(self.max_radius + 1):
+            d = np.arange(-radius, radius + 1)
+            dx, dy = np.meshgrid(d, d, indexing='ij')
+            distance = dx * dx + dy * dy
+            inside = distance <= radius * radius
+            if self.outline:
+                inside &= distance > (radius - 1) * (radius - 1)
+            self.stencils.append(dx[inside] * height + dy[inside])
+
+        self.layers = {}
+        self.size = size
+
+    def draw(self, surface, color, x, y, radius, alpha):
+        # x, y, radius: integer arrays; alpha: uint8 array or a single value
+        self.resize(surface.get_size())
+        width, height = self.size
+        margin = self.max_radius
+        mask_height = height + 2 * margin
+
+        # Circles entirely outside the margin are dropped
+        visible = (x >= radius - margin) & (x < width + margin - radius) & \
+                  (y >= radius - margin) & (y < height + margin - radius)
+        if not visible.any():
+            return
 
-    def draw(self, surface):
-        alpha = 255 * (1 - self.age / self.lifespan)
-        color_with_alpha = (*self.color, int(alpha))
-        gfxdraw.filled_circle(surface, int(self.x), int(self.y), int(self.size), color_with_alpha)
+        alpha = np.broadcast_to(np.asarray(alpha, dtype=np.uint8), visible.shape)
+        center = (x + margin) * mask_height + (y + margin)
+
+        mask = self.alpha_mask
+        mask[:] = 0
+        for r, stencil in enumerate(self.stencils):
+            selected = visible & (radius == r)
+            if len(stencil) and selected.any():
+                mask[(center[selected, None] + stencil).ravel()] = np.repeat(alpha[selected], len(stencil))
+
+        layer = self.layers.get(color)
+        if layer is None:
+            layer = pygame.Surface((width + 2 * margin, mask_height), pygame.SRCALPHA)
+            layer.fill((*color, 0))
+            self.layers[color] = layer
+        pixels = pygame.surfarray.pixels_alpha(layer)
+        pixels[:] = mask.reshape(width + 2 * margin, mask_height)
+        del pixels  # Unlock the layer before blitting it
+        surface.blit(layer, (-margin, -margin))
+
+# Particle system. Particles live in a fixed-size pool of NumPy arrays
+# (struct of arrays), so updating them is a handful of vectorized operations
+# and dead particles are compacted in place. Drawing is one CircleBatch per color.
+PARTICLE_CAPACITY = 65536
+PARTICLE_MAX_RADIUS = 5
 
 class ParticleSystem:
-    def __init__(self):
-        self.particles = []
+    def __init__(self, rng=None, capacity=PARTICLE_CAPACITY):
+        rng = rng or random
+        self.seed = rng.getrandbits(64)
+        self.np_rng = None  # Made with the first particles; importing numpy.random takes a while
+        self.capacity = capacity
+        self.count = 0
+
+        self.x = np.zeros(capacity, dtype=np.float32)
+        self.y = np.zeros(capacity, dtype=np.float32)
+        self.vx = np.zeros(capacity, dtype=np.float32)
+        self.vy = np.zeros(capacity, dtype=np.float32)
+        self.size = np.zeros(capacity, dtype=np.float32)
+        self.age = np.zeros(capacity, dtype=np.int32)
+        self.lifespan = np.zeros(capacity, dtype=np.int32)
+        self.color = np.zeros(capacity, dtype=np.int32)  # Index into self.colors
+
+        # Scratch space for compaction
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.alive_size = np.zeros(capacity, dtype=bool)
+        self.scratch_float = np.zeros(capacity, dtype=np.float32)
+        self.scratch_int = np.zeros(capacity, dtype=np.int32)
+
+        self.colors = []
+        self.circles = CircleBatch(PARTICLE_MAX_RADIUS)
+
+    def color_index(self, color):
+        if color not in self.colors:
+            self.colors.append(color)
+        return self.colors.index(color)
 
     def add_particles(self, x, y, color, count=5):
         if not settings.particle_effects:
             return
 
-        for _ in range(count):
-            self.particles.append(Particle(x, y, color))
+        count = min(count, self.capacity - self.count)
+        if count <= 0:
+            return
+
+        new = slice(self.count, self.count + count)
+        if self.np_rng is None:
+            self.np_rng = np.random.default_rng(self.seed)
+        rng = self.np_rng
+        self.x[new] = x
+        self.y[new] = y
+        self.vx[new] = rng.uniform(-2, 2, count)
+        self.vy[new] = rng.uniform(-2, 2, count)
+        self.size[new] = rng.integers(2, PARTICLE_MAX_RADIUS + 1, count)
+        self.age[new] = 0
+        self.lifespan[new] = rng.integers(20, 41, count)
+        self.color[new] = self.color_index(color)
+        self.count += count
 
     def update(self):
-        self.particles = [p for p in self.particles if p.update()]
+        n = self.count
+        if n == 0:
+            return
 
-    def draw(self, surface):
-        for p in self.particles:
-            p.draw(surface)
+        x, y, size, age, lifespan = self.x[:n], self.y[:n], self.size[:n], self.age[:n], self.lifespan[:n]
+        x += self.vx[:n]
+        y += self.vy[:n]
+        age += 1
+        size -= 0.1
+        np.maximum(size, 0, out=size)
+
+        alive = self.alive[:n]
+        np.less(age, lifespan, out=alive)
+        np.logical_and(alive, np.greater(size, 0, out=self.alive_size[:n]), out=alive)
+
+        # Move the survivors to the front of the pool
+        survivors = int(np.count_nonzero(alive))
+        if survivors < n:
+            for array in (self.x, self.y, self.vx, self.vy, self.size):
+                np.compress(alive, array[:n], out=self.scratch_float[:survivors])
+                array[:survivors] = self.scratch_float[:survivors]
+            for array in (self.age, self.lifespan, self.color):
+                np.compress(alive, array[:n], out=self.scratch_int[:survivors])
+                array[:survivors] = self.scratch_int[:survivors]
+            self.count = survivors
+
+    def bounds(self):
+        # Rect holding every particle, or None when there are none
+        n = self.count
+        if n == 0:
+            return None
+        margin = PARTICLE_MAX_RADIUS + 1
+        left = int(self.x[:n].min()) - margin
+        top = int(self.y[:n].min()) - margin
+        right = int(self.x[:n].max()) + margin
+        bottom = int(self.y[:n].max()) + margin
+        return pygame.Rect(left, top, right - left, bottom - top)
 
-# Star background for space theme
-class Star:
-    def __init__(self):
-        self.x = random.randint(0, WIDTH)
-        self.y = random.randint(0, HEIGHT)
-        self.size = random.uniform(0.1, 3)
-        self.speed = random.uniform(0.1, 0.5)
-        self.brightness = random.uniform(0.5, 1.0)
+    def draw(self, surface):
+        n = self.count
+        if n == 0:
+            return
 
-    def update(self):
+        radius = self.size[:n].astype(np.int64)
+        alpha = ((1 - self.age[:n] / self.lifespan[:n]) * 255).astype(np.uint8)
+        x = self.x[:n].astype(np.int64)
+        y = self.y[:n].astype(np.int64)
+
+        for index, color in enumerate(self.colors):
+            selected = self.color[:n] == index
+            if selected.any():
+                self.circles.draw(surface, color, x[selected], y[selected], radius[selected], alpha[selected])
+
+# Star background for space theme, kept as arrays so the whole field moves
+# and draws with a few vectorized operations
+STAR_COUNT = 100
+STAR_COLOR = (200, 200, 255)
+
+class Starfield:
+    def __init__(self, count=STAR_COUNT, rng=None):
+        rng = rng or random
+        self.np_rng = np.random.default_rng(rng.getrandbits(64))
+        self.x = self.np_rng.integers(0, WIDTH + 1, count).astype(np.float64)
+        self.y = self.np_rng.integers(0, HEIGHT + 1, count).astype(np.float64)
+        self.size = self.np_rng.uniform(0.1, 3, count)
+        self.speed = self.np_rng.uniform(0.1, 0.5, count)
+        self.brightness = self.np_rng.uniform(0.5, 1.0, count)
+        self.radius = self.size.astype(np.int64)
+        self.circles = CircleBatch(int(self.radius.max(initial=0)))
+
+    def update(self, now):
         if settings.background_motion:
             self.y += self.speed
-            if self.y > HEIGHT:
-                self.y = 0
-                self.x = random.randint(0, WIDTH)
+            wrapped = self.y > HEIGHT
+            if wrapped.any():
+                self.y[wrapped] = 0
+                self.x[wrapped] = self.np_rng.integers(0, WIDTH + 1, int(np.count_nonzero(wrapped)))
 
-    def draw(self, surface):
-        alpha = int(255 * self.brightness * (0.7 + 0.3 * math.sin(time.time() * 2)))
-        color = (200, 200, 255, alpha)
-        gfxdraw.filled_circle(surface, int(self.x), int(self.y), int(self.size), color)
+    def draw(self, surface, now):
+        alpha = (255 * self.brightness * (0.7 + 0.3 * math.sin(now * 2))).astype(np.uint8)
+        self.circles.draw(surface, STAR_COLOR, self.x.astype(np.int64), self.y.astype(np.int64), self.radius, alpha)
 
 # Bubble background for underwater theme
-class Bubble:
-    def __init__(self):
-        self.x = random.randint(0, WIDTH)
-        self.y = random.randint(0, HEIGHT)
-        self.size = random.uniform(1, 5)
-        self.speed = random.uniform(0.5, 2.0)
-        self.wobble_speed = random.uniform(1.0, 3.0)
-        self.wobble_amount = random.uniform(0.5, 2.0)
-        self.offset = random.uniform(0, 6.28)
-
-    def update(self):
+BUBBLE_COUNT = 50
+BUBBLE_COLOR = (200, 255, 255)
+
+class BubbleField:
+    def __init__(self, count=BUBBLE_COUNT, rng=None):
+        rng = rng or random
+        self.np_rng = np.random.default_rng(rng.getrandbits(64))
+        self.x = self.np_rng.integers(0, WIDTH + 1, count).astype(np.float64)
+        self.y = self.np_rng.integers(0, HEIGHT + 1, count).astype(np.float64)
+        self.size = self.np_rng.uniform(1, 5, count)
+        self.speed = self.np_rng.uniform(0.5, 2.0, count)
+        self.wobble_speed = self.np_rng.uniform(1.0, 3.0, count)
+        self.wobble_amount = self.np_rng.uniform(0.5, 2.0, count)
+        self.offset = self.np_rng.uniform(0, 6.28, count)
+        self.radius = self.size.astype(np.int64)
+        self.circles = CircleBatch(int(self.radius.max(initial=0)), outline=True)
+
+    def update(self, now):
         if settings.background_motion:
             self.y -= self.speed
-            self.x += math.sin((time.time() + self.offset) * self.wobble_speed) * self.wobble_amount
-            if self.y < 0:
-                self.y = HEIGHT
-                self.x = random.randint(0, WIDTH)
-
-    def draw(self, surface):
-        alpha = int(128 + 127 * math.sin(time.time() + self.offset))
-        color = (200, 255, 255, alpha)
-        pygame.draw.circle(surface, color, (int(self.x), int(self.y)), int(self.size), 1)
-
-# Grid lines for the background
-class Grid:
-    def __init__(self):
-        self.visible = True
-
-    def draw(self, surface, color):
-        if not settings.grid_visible:
-            return
-
-        for x in range(0, WIDTH, GRID_SIZE):
-            pygame.draw.line(surface, color, (x, 0), (x, HEIGHT), 1)
-        for y in range(0, HEIGHT, GRID_SIZE):
-            pygame.draw.line(surface, color, (0, y), (WIDTH, y), 1)
-
-# Snake class
-class Snake:
-    def __init__(self):
-        self.reset()
-
-    def reset(self):
-        self.length = 3
-        self.positions = [(GRID_WIDTH // 2, GRID_HEIGHT // 2)]
-        self.direction = random.choice([(1, 0), (0, 1), (-1, 0), (0, -1)])
-        self.score = 0
-        self.grid = [[0 for _ in range(GRID_HEIGHT)] for _ in range(GRID_WIDTH)]
-        self.last_move_time = time.time()
-        self.special_effect = None
-        self.special_effect_end = 0
-        self.grow_queue = 0
-        self.trail = []
-
-    def update(self):
-        current = time.time()
-        speed_factor = 1.0
-
-        # Apply special effects
-        if self.special_effect == 'speed_boost':
-            speed_factor = 1.5
-        elif self.special_effect == 'slow_motion':
-            speed_factor = 0.5
-
-        # End special effect if time is up
-        if self.special_effect and current > self.special_effect_end:
-            self.special_effect = None
-
-        # Update based on speed
-        move_delay = 1.0 / settings.get_speed() / speed_factor
-        if current - self.last_move_time >= move_delay:
-            self.last_move_time = current
-
-            # Update trail if enabled
-            if settings.trail_effect:
-                for i in range(len(self.trail)):
-                    self.trail[i]['alpha'] -= 5
-                self.trail = [t for t in self.trail if t['alpha'] > 0]
-
-                # Add current positions to trail
-                for i, pos in enumerate(self.positions):
-                    if i % 2 == 0:  # Only add every other position to avoid too many trail particles
-                        self.trail.append({
-                            'pos': pos,
-                            'alpha': 128
-                        })
-
-            # Calculate new head position
-            head = self.positions[0]
-            new_head = ((head[0] + self.direction[0]) % GRID_WIDTH,
-                        (head[1] + self.direction[1]) % GRID_HEIGHT)
-
-            # Check if the snake hit itself
-            if new_head in self.positions:
-                return False
-
-            # Check if the snake hit an obstacle
-            if self.grid[new_head[0]][new_head[1]] == 2:  # 2 represents an obstacle
-                return False
-
-            # Add the new head to the beginning of positions list
-            self.positions.insert(0, new_head)
-
-            # Check if we need to grow the snake
-            if self.grow_queue > 0:
-                self.grow_queue -= 1
-            else:
-                # Remove the tail if not growing
-                self.positions.pop()
-
-            return True
-        return True
-
-    def grow(self, amount=1):
-        self.grow_queue += amount
-
-    def check_food_collision(self, food):
-        if self.positions[0] == food.position:
-            self.score += food.value
-            self.grow(food.growth)
-
-            # Apply special effects based on food type
-            if food.food_type == 'speed_boost':
-                self.special_effect = 'speed_boost'
-                self.special_effect_end = time.time() + 5  # 5 seconds boost
-            elif food.food_type == 'slow_motion':
-                self.special_effect = 'slow_motion'
-                self.special_effect_end = time.time() + 5  # 5 seconds slow motion
-
-            return True
-        return False
-
-    def change_direction(self, new_direction):
-        # Prevent 180 degree turns
-        if (self.direction[0] + new_direction[0] != 0 or
-            self.direction[1] + new_direction[1] != 0):
-            self.direction = new_direction
-
-    def draw(self, surface, theme_colors):
-        # Draw trail
-        if settings.trail_effect:
-            for trail_piece in self.trail:
-                x, y = trail_piece['pos']
-                alpha = trail_piece['alpha']
-                color = (*theme_colors['snake_body'], alpha)
-
-                rect = pygame.Rect(
-                    x * GRID_SIZE,
-                    y * GRID_SIZE,
-                    GRID_SIZE,
-                    GRID_SIZE
-                )
-                shape_surf = pygame.Surface(rect.size, pygame.SRCALPHA)
-                pygame.draw.rect(shape_surf, color, shape_surf.get_rect(), border_radius=int(GRID_SIZE/4))
-                surface.blit(shape_surf, rect)
-
-        # Draw snake body based on style
-        for i, (x, y) in enumerate(self.positions):
-            if i == 0:  # Head
-                color = theme_colors['snake_head']
-                rect = pygame.Rect(
-                    x * GRID_SIZE,
-                    y * GRID_SIZE,
-                    GRID_SIZE,
-                    GRID_SIZE
-                )
-                pygame.draw.rect(surface, color, rect, border_radius=int(GRID_SIZE/3))
-
-                # Draw eyes
-                eye_size = GRID_SIZE // 4
-                eye_offset = GRID_SIZE // 4
-
-                # Position eyes based on direction
-                if self.direction == (1, 0):  # Right
-                    left_eye = (x * GRID_SIZE + GRID_SIZE - eye_offset, y * GRID_SIZE + eye_offset)
-                    right_eye = (x * GRID_SIZE + GRID_SIZE - eye_offset, y * GRID_SIZE + GRID_SIZE - eye_offset - eye_size)
-                elif self.direction == (-1, 0):  # Left
-                    left_eye = (x * GRID_SIZE + eye_offset, y * GRID_SIZE + eye_offset)
-                    right_eye = (x * GRID_SIZE + eye_offset, y * GRID_SIZE + GRID_SIZE - eye_offset - eye_size)
-                elif self.direction == (0, 1):  # Down
-                    left_eye = (x * GRID_SIZE + eye_offset, y * GRID_SIZE + GRID_SIZE - eye_offset - eye_size)
-                    right_eye = (x * GRID_SIZE + GRID_SIZE - eye_offset - eye_size, y * GRID_SIZE + GRID_SIZE - eye_offset - eye_size)
-                else:  # Up
-                    left_eye = (x * GRID_SIZE + eye_offset, y * GRID_SIZE + eye_offset)
-                    right_eye = (x * GRID_SIZE + GRID_SIZE - eye_offset - eye_size, y * GRID_SIZE + eye_offset)
-
-                pygame.draw.rect(surface, BLACK, (left_eye[0], left_eye[1], eye_size, eye_size))
-                pygame.draw.rect(surface, BLACK, (right_eye[0], right_eye[1], eye_size, eye_size))
-
-            else:  # Body
-                if settings.snake_style == 0:  # Classic
-                    color = theme_colors['snake_body']
-                elif settings.snake_style == 1:  # Gradient
-                    ratio = i / max(len(self.positions) - 1, 1)
-                    color = get_gradient_color(theme_colors['snake_head'], theme_colors['snake_body'], ratio)
-                elif settings.snake_style == 2:  # Patterned
-                    color = theme_colors['snake_body'] if i % 2 == 0 else theme_colors['snake_head']
-                else:  # Glowing
-                    pulse = (math.sin(time.time() * 3 + i * 0.2) + 1) / 2
-                    color = get_gradient_color(theme_colors['snake_body'], theme_colors['snake_head'], pulse)
-
-                rect = pygame.Rect(
-                    x * GRID_SIZE,
-                    y * GRID_SIZE,
-                    GRID_SIZE,
-                    GRID_SIZE
-                )
-                pygame.draw.rect(surface, color, rect, border_radius=int(GRID_SIZE/4))
-
-# Food class
-class Food:
-    def __init__(self, grid, snake_positions):
-        self.grid = grid
-        self.reset(snake_positions)
-
-    def reset(self, snake_positions):
-        # Select food type
-        if settings.special_foods and random.random() < 0.2:  # 20% chance for special food
-            self.food_type = random.choice(['normal', 'bonus', 'speed_boost', 'slow_motion'])
-        else:
-            self.food_type = 'normal'
-
-        # Set properties based on food type
-        if self.food_type == 'normal':
-            self.value = 1
-            self.growth = 1
-            self.color = None  # Will use theme color
-        elif self.food_type == 'bonus':
-            self.value = 5
-            self.growth = 2
-            self.color = YELLOW
-        elif self.food_type == 'speed_boost':
-            self.value = 2
-            self.growth = 1
-            self.color = CYAN
-        elif self.food_type == 'slow_motion':
-            self.value = 2
-            self.growth = 1
-            self.color = PURPLE
-
-        # Find an available position
-        available_positions = []
-        for x in range(GRID_WIDTH):
-            for y in range(GRID_HEIGHT):
-                if (x, y) not in snake_positions and self.grid[x][y] != 2:
-                    available_positions.append((x, y))
-
-        if available_positions:
-            self.position = random.choice(available_positions)
-        else:
-            # If no positions available, just pick a random spot (game is likely almost over anyway)
-            self.position = (random.randint(0, GRID_WIDTH-1), random.randint(0, GRID_HEIGHT-1))
-
-    def draw(self, surface, theme_colors):
-        x, y = self.position
-
-        if self.food_type == 'normal':
-            color = theme_colors['food']
-            pygame.draw.circle(surface, color,
-                              (x * GRID_SIZE + GRID_SIZE // 2, y * GRID_SIZE + GRID_SIZE // 2),
-                              GRID_SIZE // 2 - 2)
-        elif self.food_type == 'bonus':
+            self.x += np.sin((now + self.offset) * self.wobble_speed) * self.wobble_amount
+            wrapped = self.y < 0
+            if wrapped.any():
+                self.y[wrapped] = HEIGHT
+                self.x[wrapped] = self.np_rng.integers(0, WIDTH + 1, int(np.count_nonzero(wrapped)))
+
+    def draw(self, surface, now):
+        alpha = (128 + 127 * np.sin(now + self.offset)).astype(np.uint8)
+        self.circles.draw(surface, BUBBLE_COLOR, self.x.astype(np.int64), self.y.astype(np.int64), self.radius, alpha)
+
+# Colors for the special food types
+FOOD_COLORS = {
+    'bonus': YELLOW,
+    'speed_boost': CYAN,
+    'slow_motion': PURPLE,
+}
+
+
+# Pre-rendered cell tiles for one theme and snake style, so the board is drawn
+# with a few Surface.blits calls instead of rebuilding shapes every frame
+class SpriteAtlas:
+    def __init__(self, theme, snake_style, theme_colors):
+        self.theme = theme
+        self.theme_colors = theme_colors
+
+        self.heads = {}
+        for direction in [(1, 0), (0, 1), (-1, 0), (0, -1)]:
+            tile = self.new_tile()
+            self.draw_head(tile, direction)
+            self.heads[direction] = tile
+
+        # One body tile per color in the style's ramp
+        self.body = []
+        for color in COLOR_RAMPS[(theme, snake_style)]:
+            tile = self.new_tile()
+            pygame.draw.rect(tile, color, tile.get_rect(), border_radius=int(GRID_SIZE/4))
+            self.body.append(tile)
+
+        self.foods = {}
+        for food_type in ['normal', 'bonus', 'speed_boost', 'slow_motion']:
+            tile = self.new_tile()
+            self.draw_food(tile, food_type)
+            self.foods[food_type] = tile
+
+        # Classic bricks differ between even and odd columns
+        self.obstacles = []
+        for column in range(2):
+            tile = self.new_tile()
+            self.draw_obstacle(tile, column)
+            self.obstacles.append(tile)
+
+    def new_tile(self):
+        return pygame.Surface((GRID_SIZE, GRID_SIZE), pygame.SRCALPHA)
+
+    def draw_head(self, surface, direction):
+        rect = surface.get_rect()
+        pygame.draw.rect(surface, self.theme_colors['snake_head'], rect, border_radius=int(GRID_SIZE/3))
+
+        # Draw eyes
+        eye_size = GRID_SIZE // 4
+        eye_offset = GRID_SIZE // 4
+
+        # Position eyes based on direction
+        if direction == (1, 0):  # Right
+            left_eye = (GRID_SIZE - eye_offset, eye_offset)
+            right_eye = (GRID_SIZE - eye_offset, GRID_SIZE - eye_offset - eye_size)
+        elif direction == (-1, 0):  # Left
+            left_eye = (eye_offset, eye_offset)
+            right_eye = (eye_offset, GRID_SIZE - eye_offset - eye_size)
+        elif direction == (0, 1):  # Down
+            left_eye = (eye_offset, GRID_SIZE - eye_offset - eye_size)
+            right_eye = (GRID_SIZE - eye_offset - eye_size, GRID_SIZE - eye_offset - eye_size)
+        else:  # Up
+            left_eye = (eye_offset, eye_offset)
+            right_eye = (GRID_SIZE - eye_offset - eye_size, eye_offset)
+
+        pygame.draw.rect(surface, BLACK, (left_eye[0], left_eye[1], eye_size, eye_size))
+        pygame.draw.rect(surface, BLACK, (right_eye[0], right_eye[1], eye_size, eye_size))
+
+    def draw_food(self, surface, food_type):
+        theme_colors = self.theme_colors
+        center_x = GRID_SIZE // 2
+        center_y = GRID_SIZE // 2
+        radius = GRID_SIZE // 2 - 2
+
+        if food_type == 'normal':
+            pygame.draw.circle(surface, theme_colors['food'], (center_x, center_y), radius)
+        elif food_type == 'bonus':
             # Star-shaped bonus food
-            color = theme_colors['special_food']
-            center_x = x * GRID_SIZE + GRID_SIZE // 2
-            center_y = y * GRID_SIZE + GRID_SIZE // 2
-            radius = GRID_SIZE // 2 - 2
             points = []
-
             for i in range(10):
                 angle = math.pi * 2 * i / 10
                 r = radius if i % 2 == 0 else radius // 2
@@ -451,28 +383,23 @@ class Food:
                     center_y + int(math.sin(angle) * r)
                 ))
 
-            pygame.draw.polygon(surface, color, points)
-        elif self.food_type == 'speed_boost':
+            pygame.draw.polygon(surface, theme_colors['special_food'], points)
+        elif food_type == 'speed_boost':
             # Lightning bolt for speed boost
-            color = self.color
-            rect = pygame.Rect(x * GRID_SIZE + 2, y * GRID_SIZE + 2, GRID_SIZE - 4, GRID_SIZE - 4)
-            pygame.draw.rect(surface, color, rect)
+            rect = pygame.Rect(2, 2, GRID_SIZE - 4, GRID_SIZE - 4)
+            pygame.draw.rect(surface, FOOD_COLORS['speed_boost'], rect)
 
             # Lightning shape inside
             points = [
-                (x * GRID_SIZE + GRID_SIZE // 2, y * GRID_SIZE + 3),
-                (x * GRID_SIZE + GRID_SIZE // 3, y * GRID_SIZE + GRID_SIZE // 2),
-                (x * GRID_SIZE + GRID_SIZE // 2 + 2, y * GRID_SIZE + GRID_SIZE // 2),
-                (x * GRID_SIZE + GRID_SIZE // 2, y * GRID_SIZE + GRID_SIZE - 3)
+                (GRID_SIZE // 2, 3),
+                (GRID_SIZE // 3, GRID_SIZE // 2),
+                (GRID_SIZE // 2 + 2, GRID_SIZE // 2),
+                (GRID_SIZE // 2, GRID_SIZE - 3)
             ]
             pygame.draw.polygon(surface, theme_colors['background'], points)
-        elif self.food_type == 'slow_motion':
+        elif food_type == 'slow_motion':
             # Clock-like shape for slow motion
-            color = self.color
-            center_x = x * GRID_SIZE + GRID_SIZE // 2
-            center_y = y * GRID_SIZE + GRID_SIZE // 2
-            radius = GRID_SIZE // 2 - 2
-
+            color = FOOD_COLORS['slow_motion']
             pygame.draw.circle(surface, color, (center_x, center_y), radius)
             pygame.draw.circle(surface, theme_colors['background'], (center_x, center_y), radius - 3)
             pygame.draw.line(surface, color, (center_x, center_y),
@@ -480,359 +407,876 @@ class Food:
             pygame.draw.line(surface, color, (center_x, center_y),
                             (center_x + radius - 3, center_y), 2)
 
-# Obstacle generator
-class ObstacleGenerator:
-    def __init__(self, grid, snake_positions):
-        self.grid = grid
-        self.obstacles = []
-        self.generate_obstacles(snake_positions)
-
-    def generate_obstacles(self, snake_positions):
-        if not settings.obstacles:
+    def draw_obstacle(self, surface, column):
+        theme_colors = self.theme_colors
+        rect = surface.get_rect()
+
+        if self.theme == 0:  # Classic concrete blocks
+            pygame.draw.rect(surface, theme_colors['obstacle'], rect)
+            pygame.draw.rect(surface, theme_colors['obstacle_shadow'], rect, 1)
+
+            # Add brick pattern
+            for i in range(2):
+                line_y = (i + 1) * GRID_SIZE // 3
+                pygame.draw.line(surface, theme_colors['obstacle_shadow'],
+                                (0, line_y),
+                                (GRID_SIZE, line_y), 1)
+
+            if column % 2 == 0:
+                line_x = GRID_SIZE // 2
+                pygame.draw.line(surface, theme_colors['obstacle_shadow'],
+                                (line_x, 0),
+                                (line_x, GRID_SIZE), 1)
+
+        elif self.theme == 1:  # Neon barriers
+            border_width = 2
+            pygame.draw.rect(surface, theme_colors['obstacle'], rect)
+
+            inner_rect = pygame.Rect(
+                border_width,
+                border_width,
+                GRID_SIZE - 2 * border_width,
+                GRID_SIZE - 2 * border_width
+            )
+            pygame.draw.rect(surface, theme_colors['obstacle_highlight'], inner_rect)
+
+            glow_color = theme_colors['obstacle_glow']
+            pygame.draw.rect(surface, glow_color, rect, 1)
+
+        elif self.theme == 2:  # Space asteroids
+            # Draw rocky asteroid
+            pygame.draw.rect(surface, theme_colors['obstacle'], rect, border_radius=int(GRID_SIZE/3))
+
+            # Add crater details
+            center_x = GRID_SIZE // 2
+            center_y = GRID_SIZE // 2
+            pygame.draw.circle(surface, theme_colors['obstacle_shadow'],
+                              (center_x - 3, center_y - 3), GRID_SIZE // 6)
+            pygame.draw.circle(surface, theme_colors['obstacle_shadow'],
+                              (center_x + 4, center_y + 2), GRID_SIZE // 8)
+
+        else:  # Underwater coral
+            pygame.draw.rect(surface, theme_colors['obstacle'], rect, border_radius=int(GRID_SIZE/4))
+
+            # Add coral-like details
+            for i in range(3):
+                detail_x = i * GRID_SIZE // 3 + GRID_SIZE // 6
+                pygame.draw.line(surface, theme_colors['obstacle_highlight'],
+                                (detail_x, GRID_SIZE),
+                                (detail_x, GRID_SIZE // 2), 2)
+
+# Semi-transparent cell tiles for the trail, rendered once per color and alpha level
+class AlphaTileCache:
+    def __init__(self):
+        self.tiles = {}
+
+    def get(self, color, alpha):
+        tile = self.tiles.get((color, alpha))
+        if tile is None:
+            tile = pygame.Surface((GRID_SIZE, GRID_SIZE), pygame.SRCALPHA)
+            pygame.draw.rect(tile, (*color, alpha), tile.get_rect(), border_radius=int(GRID_SIZE/4))
+            self.tiles[(color, alpha)] = tile
+        return tile
+
+# Ramp index of the Glowing style's pulse over one period, so each segment's
+# color is an integer table lookup. Neighbouring segments are about 0.2 radians apart.
+GLOW_TABLE_SIZE = 2048
+GLOW_SEGMENT_STEP = round(0.2 * GLOW_TABLE_SIZE / (2 * math.pi))
+GLOW_TABLE = [int((math.sin(2 * math.pi * k / GLOW_TABLE_SIZE) + 1) * (RAMP_STEPS - 1) / 2 + 0.5)
+              for k in range(GLOW_TABLE_SIZE)]
+
+# Frame profiler. Each frame is split into phases by calling mark(phase) when
+# a phase ends; the time since the previous mark is added to that phase. The
+# last PROFILE_FRAMES frames are kept in a ring buffer of milliseconds per
+# phase. While disabled, begin_frame and mark return straight away.
+PROFILE_PHASES = (
+    'frame', 'events', 'update_particles', 'update_background', 'update_snake',
+    'background', 'static', 'food', 'trail', 'snake', 'particles', 'hud', 'overlay', 'display', 'idle',
+)
+PROFILE_FRAMES = 600
+PROFILE_GRAPH_FRAMES = 240
+PROFILE_REFRESH = 30  # Frames between overlay text updates
+
+class FrameProfiler:
+    def __init__(self, frames=PROFILE_FRAMES):
+        self.enabled = False
+        self.phase_index = {phase: i for i, phase in enumerate(PROFILE_PHASES)}
+        self.samples = np.zeros((frames, len(PROFILE_PHASES)), dtype=np.float64)
+        self.cursor = 0
+        self.count = 0
+        self.current = [0.0] * len(PROFILE_PHASES)
+        self.frame_start = None
+        self.last = None
+        self.panel = None
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self.frame_start = None
+        self.panel = None
+
+    def begin_frame(self):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if self.frame_start is not None:
+            current = self.current
+            current[0] = now - self.frame_start
+            self.samples[self.cursor] = current
+            self.samples[self.cursor] *= 1000
+            self.cursor = (self.cursor + 1) % len(self.samples)
+            self.count = min(self.count + 1, len(self.samples))
+        self.current = [0.0] * len(PROFILE_PHASES)
+        self.frame_start = self.last = now
+
+    def mark(self, phase):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.current[self.phase_index[phase]] += now - self.last
+        self.last = now
+
+    def recent(self):
+        # Recorded frames, oldest first
+        if self.count < len(self.samples):
+            return self.samples[:self.count]
+        return np.roll(self.samples, -self.cursor, axis=0)
+
+    def percentiles(self):
+        # Rows p50, p95, p99; one column per phase
+        if self.count == 0:
+            return np.zeros((3, len(PROFILE_PHASES)))
+        return np.percentile(self.recent(), [50, 95, 99], axis=0)
+
+    def export_csv(self, path):
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(('frame_index',) + tuple(f"{phase}_ms" for phase in PROFILE_PHASES))
+            for i, row in enumerate(self.recent()):
+                writer.writerow([i] + [f"{value:.4f}" for value in row])
+
+    def draw(self, surface, font):
+        # Table of percentiles, refreshed every PROFILE_REFRESH frames
+        if self.panel is None or self.cursor % PROFILE_REFRESH == 0:
+            self.panel = self.build_panel(font)
+        surface.blit(self.panel, (10, 50))
+
+        # Frame-time graph of the latest frames, 1px per frame, against the frame budget
+        budget = 1000 / FPS
+        frame_times = self.recent()[-PROFILE_GRAPH_FRAMES:, 0]
+        left = 10
+        bottom = 50 + self.panel.get_height() + 70
+        scale = 30 / budget  # 2 budgets tall is 60 px
+        pygame.draw.line(surface, WHITE, (left, bottom - budget * scale),
+                         (left + PROFILE_GRAPH_FRAMES, bottom - budget * scale), 1)
+        for i, frame_time in enumerate(frame_times):
+            color = GREEN if frame_time <= budget * 1.05 else RED
+            pygame.draw.line(surface, color, (left + i, bottom), (left + i, bottom - min(frame_time * scale, 60)), 1)
+
+    def build_panel(self, font):
+        stats = self.percentiles()
+        rows = [("phase", "p50", "p95", "p99")]
+        rows += [(phase, *(f"{stats[p, i]:.2f}" for p in range(3))) for i, phase in enumerate(PROFILE_PHASES)]
+        rows.append((f"ms, last {self.count} frames", "", "", ""))
+
+        # Phase names left-aligned, numbers right-aligned in fixed columns
+        line_height = font.get_linesize()
+        name_width = max(font.size(row[0])[0] for row in rows[:-1]) + 10
+        column_width = font.size("000.00")[0] + 10
+        panel = pygame.Surface((name_width + 3 * column_width + 10, line_height * len(rows) + 10), pygame.SRCALPHA)
+        panel.fill((0, 0, 0, 180))
+        for i, row in enumerate(rows):
+            y = 5 + i * line_height
+            panel.blit(font.render(row[0], True, WHITE), (5, y))
+            for column, text in enumerate(row[1:], 1):
+                label = font.render(text, True, WHITE)
+                panel.blit(label, (5 + name_width + column * column_width - label.get_width(), y))
+        return panel
+
+# Draws the engine's board, snake, food and obstacles with pygame
+class PygameRenderer(Renderer):
+    def __init__(self, surface, profiler=None):
+        self.surface = surface
+        self.profiler = profiler or FrameProfiler()
+        self.static_layer = None
+        self.static_key = None
+        self.atlas = None
+        self.atlas_key = None
+        self.trail_tiles = AlphaTileCache()
+        self.now = None  # Frame timestamp for animations, set by the game each frame
+        self.interpolation = None  # Fraction of the next move to draw the snake at, None for whole cells
+        self.drawn_cells = None  # Cell -> tiles on screen, for draw_changes
+        self.drawn_covered = set()  # Cells the sliding snake covered, for draw_changes
+        self.drawn_layer = None
+        self.camera = (0, 0)  # Board cell at the top-left of the screen
+        self.camera_board = (GRID_WIDTH, GRID_HEIGHT)
+
+    def get_atlas(self):
+        # Tiles are baked once per theme and snake style
+        key = (settings.theme, settings.snake_style)
+        if key != self.atlas_key:
+            self.atlas = SpriteAtlas(settings.theme, settings.snake_style, settings.get_theme_colors())
+            self.atlas_key = key
+        return self.atlas
+
+    def draw(self, engine):
+        if self.scrolls(engine):
+            self.draw_view(engine)
             return
+        self.camera = (0, 0)
+        self.camera_board = (engine.width, engine.height)
 
-        # Clear previous obstacles
-        for x in range(GRID_WIDTH):
-            for y in range(GRID_HEIGHT):
-                if self.grid[x][y] == 2:  # 2 represents obstacle
-                    self.grid[x][y] = 0
+        theme_colors = settings.get_theme_colors()
+        # Keep tiles sliding over the edge of a board smaller than the screen off the margin
+        clip = self.surface.get_clip()
+        self.surface.set_clip(clip.clip(self.board_rect(engine)))
+        self.draw_foods(engine.foods)
+        self.profiler.mark('food')
+        self.draw_snake(engine.snake, theme_colors)
+        self.surface.set_clip(clip)
+
+    def board_rect(self, engine):
+        return pygame.Rect(0, 0, engine.width * GRID_SIZE, engine.height * GRID_SIZE)
+
+    def draw_changes(self, engine, regions):
+        # Redraws only the cells whose tiles differ from the last call, plus every
+        # cell inside regions (cell-aligned rects the caller draws over, like the HUD).
+        # A sliding snake sits between cells, so every cell it covers now or covered
+        # last time is redrawn too: its own cells and the one its tail just left.
+        # Returns the screen rects that changed, or None after a full redraw.
+        theme_colors = settings.get_theme_colors()
+        layer = self.get_static_layer(engine.obstacles, theme_colors)
+        snake = engine.snake
+        blits = self.food_blits(engine.foods) + self.trail_blits(snake, theme_colors)
+        if self.interpolation is None:
+            blits += self.body_blits(snake)
+            body = []
+            covered = set()
+        else:
+            body = self.body_blits(snake)
+            covered = {(x * GRID_SIZE, y * GRID_SIZE) for x, y in snake.positions}
+            if snake.vacated:
+                covered.add((snake.vacated[0] * GRID_SIZE, snake.vacated[1] * GRID_SIZE))
+        cells = {}
+        for tile, position in blits:
+            cells.setdefault(position, []).append(tile)
+
+        drawn = self.drawn_cells
+        drawn_covered = self.drawn_covered
+        self.drawn_cells = cells
+        self.drawn_covered = covered
+        surface = self.surface
+        if (drawn is None or layer is not self.drawn_layer
+                or len(covered) + len(drawn_covered) > DIRTY_CELL_LIMIT):
+            self.drawn_layer = layer
+            surface.blit(layer, (0, 0))
+            surface.blits(blits, doreturn=False)
+            clip = surface.get_clip()
+            surface.set_clip(clip.clip(self.board_rect(engine)))
+            surface.blits(body, doreturn=False)
+            surface.set_clip(clip)
+            return None
+
+        changed = {position for position, tiles in cells.items() if drawn.get(position) != tiles}
+        changed.update(position for position in drawn if position not in cells)
+        changed.update(covered)
+        changed.update(drawn_covered)
+        rects = regions + [pygame.Rect(position, (GRID_SIZE, GRID_SIZE)) for position in changed]
+
+        # Put the background back, then the tiles of every cell in a changed rect
+        surface.blits([(layer, rect, rect) for rect in rects], doreturn=False)
+        self.profiler.mark('static')
+        surface.blits([(tile, position) for position, tiles in cells.items()
+                       if position in changed or any(region.collidepoint(position) for region in regions)
+                       for tile in tiles], doreturn=False)
+        clip = surface.get_clip()
+        surface.set_clip(clip.clip(self.board_rect(engine)))
+        surface.blits(body, doreturn=False)  # Only covers cells redrawn above
+        surface.set_clip(clip)
+        self.profiler.mark('snake')
+        return rects
+
+    def draw_static(self, obstacles, theme_colors, transparent=False):
+        self.surface.blit(self.get_static_layer(obstacles, theme_colors, transparent), (0, 0))
+
+    def get_static_layer(self, obstacles, theme_colors, transparent=False):
+        # The background, grid and obstacles only change with the theme, the grid
+        # setting or the obstacle layout, so they are drawn once into a cached layer.
+        # A transparent layer leaves out the background so animated backdrops show through.
+        key = (settings.theme, settings.grid_visible, transparent, obstacles.layout_id if obstacles else None,
+               (obstacles.grid.width, obstacles.grid.height) if obstacles else None)
+        if key != self.static_key:
+            self.static_layer = self.build_static_layer(obstacles, theme_colors, transparent)
+            self.static_key = key
+        return self.static_layer
+
+    def build_static_layer(self, obstacles, theme_colors, transparent):
+        if transparent:
+            layer = pygame.Surface(self.surface.get_size(), pygame.SRCALPHA)
+        else:
+            layer = pygame.Surface(self.surface.get_size(), 0, self.surface)
+            layer.fill(theme_colors['background'])
+
+        # A board smaller than the screen sits in the top-left corner: the grid
+        # stops at its edges and a border marks where the snake wraps
+        board = layer.get_rect()
+        if obstacles:
+            board = board.clip(pygame.Rect(0, 0, obstacles.grid.width * GRID_SIZE, obstacles.grid.height * GRID_SIZE))
+        self.draw_grid(layer, theme_colors['grid'], board)
+        if board != layer.get_rect():
+            pygame.draw.rect(layer, theme_colors['grid'], board.inflate(2, 2), 1)
+        if obstacles:
+            self.draw_obstacles(layer, obstacles)
+        return layer
+
+    def draw_grid(self, surface, color, area=None):
+        if not settings.grid_visible:
+            return
 
-        self.obstacles = []
+        area = area or surface.get_rect()
+        for x in range(area.left, area.right, GRID_SIZE):
+            pygame.draw.line(surface, color, (x, area.top), (x, area.bottom), 1)
+        for y in range(area.top, area.bottom, GRID_SIZE):
+            pygame.draw.line(surface, color, (area.left, y), (area.right, y), 1)
+
+    def draw_obstacles(self, surface, obstacles):
+        tiles = self.get_atlas().obstacles
+        surface.blits([(tiles[x % 2], (x * GRID_SIZE, y * GRID_SIZE)) for x, y in obstacles.obstacles], doreturn=False)
+
+    def draw_foods(self, foods):
+        self.surface.blits(self.food_blits(foods), doreturn=False)
+
+    def draw_snake(self, snake, theme_colors):
+        self.surface.blits(self.trail_blits(snake, theme_colors), doreturn=False)
+        self.profiler.mark('trail')
+        self.surface.blits(self.body_blits(snake), doreturn=False)
+        self.profiler.mark('snake')
+
+    def food_blits(self, foods):
+        tiles = self.get_atlas().foods
+        return [(tiles[food.food_type], (food.position[0] * GRID_SIZE, food.position[1] * GRID_SIZE))
+                for food in foods]
+
+    def snake_blits(self, snake, theme_colors):
+        return self.trail_blits(snake, theme_colors) + self.body_blits(snake)
+
+    def trail_blits(self, snake, theme_colors):
+        if not settings.trail_effect:
+            return []
+        color = theme_colors['snake_body']
+        get_tile = self.trail_tiles.get
+        return [(get_tile(color, alpha), (x * GRID_SIZE, y * GRID_SIZE))
+                for x, y, alpha in snake.trail.pieces(snake.moves)]
+
+    def body_blits(self, snake):
+        # Snake body based on style, one tile per segment
+        if self.interpolation is not None and snake.moves:
+            return self.sliding_body_blits(snake, self.interpolation)
+        atlas = self.get_atlas()
+        segments = itertools.islice(snake.positions, 1, None)
+        tile = self.body_tile(snake)
+        blits = [(tile(i), (x * GRID_SIZE, y * GRID_SIZE)) for i, (x, y) in enumerate(segments, 1)]
+
+        # Head
+        x, y = snake.positions[0]
+        blits.append((atlas.heads[snake.direction], (x * GRID_SIZE, y * GRID_SIZE)))
+        return blits
+
+    def sliding_body_blits(self, snake, fraction):
+        # Every segment drawn `fraction` of the way from the cell behind it (where
+        # it was before the last move) to its own cell. A tile sliding across the
+        # edge of the board is drawn on both sides.
+        atlas = self.get_atlas()
+        tile = self.body_tile(snake)
+        width, height = snake.width, snake.height
+        positions = snake.positions
+        behind = itertools.chain(itertools.islice(positions, 1, None), [snake.vacated or positions[-1]])
+        blits = []
+        for i, ((x, y), (bx, by)) in enumerate(zip(positions, behind)):
+            image = tile(i) if i else atlas.heads[snake.direction]
+            fx = (bx + ((x - bx + 1) % width - 1) * fraction) % width
+            fy = (by + ((y - by + 1) % height - 1) * fraction) % height
+            px, py = round(fx * GRID_SIZE), round(fy * GRID_SIZE)
+            blits.append((image, (px, py)))
+            if fx > width - 1:
+                blits.append((image, (px - width * GRID_SIZE, py)))
+            if fy > height - 1:
+                blits.append((image, (px, py - height * GRID_SIZE)))
+        blits.reverse()  # Head on top
+        return blits
+
+    def body_tile(self, snake):
+        # Function from a segment's place behind the head (1 = first) to its tile
+        body = self.get_atlas().body
+        if settings.snake_style == 0:  # Classic
+            return lambda i: body[0]
+        elif settings.snake_style == 1:  # Gradient
+            scale = (RAMP_STEPS - 1) / max(len(snake.positions) - 1, 1)
+            return lambda i: body[int(i * scale + 0.5)]
+        elif settings.snake_style == 2:  # Patterned
+            return lambda i: body[i % 2]
+        else:  # Glowing
+            phase = int((self.now or time.time()) * 3 * GLOW_TABLE_SIZE / (2 * math.pi))
+            return lambda i: body[GLOW_TABLE[(phase + i * GLOW_SEGMENT_STEP) % GLOW_TABLE_SIZE]]
+
+    def scrolls(self, engine):
+        # Boards bigger than the screen are drawn through a camera that follows the head
+        width, height = self.surface.get_size()
+        return engine.width * GRID_SIZE > width or engine.height * GRID_SIZE > height
+
+    def screen_position(self, pos):
+        # Top-left pixel of a board cell under the camera
+        left, top = self.camera
+        width, height = self.camera_board
+        return ((pos[0] - left) % width * GRID_SIZE, (pos[1] - top) % height * GRID_SIZE)
+
+    def draw_view(self, engine):
+        # Centre the camera on the head and draw only what is on screen. The
+        # board is read column by column over the visible cells only, and each
+        # snake cell's place in the body comes from Snake.entered, so the cost
+        # depends on the screen size, not on the board or the snake length.
+        snake = engine.snake
+        width, height = engine.width, engine.height
+        columns = min(self.surface.get_width() // GRID_SIZE, width)
+        rows = min(self.surface.get_height() // GRID_SIZE, height)
+        head_x, head_y = snake.positions[0]
+        left = (head_x - columns // 2) % width if columns < width else 0
+        top = (head_y - rows // 2) % height if rows < height else 0
+        self.camera = (left, top)
+        self.camera_board = (width, height)
+
+        atlas = self.get_atlas()
+        cells = snake.grid.cells
+        entered = snake.entered
+        moves = snake.moves
+        obstacle_tiles = atlas.obstacles
+        ys = [(top + sy) % height for sy in range(rows)]
+        wrapped = top + rows > height
+
+        obstacles = []
+        segments = []  # (place behind the head, screen position)
+        for sx in range(columns):
+            x = (left + sx) % width
+            column = cells[x]
+            visible = column[top:top + rows] if not wrapped else column[top:] + column[:top + rows - height]
+            if visible.count(0) == rows:
+                continue  # Nothing but empty cells
+            px = sx * GRID_SIZE
+            column_entered = entered[x]
+            for sy, value in enumerate(visible):
+                if value == OBSTACLE:
+                    obstacles.append((obstacle_tiles[x % 2], (px, sy * GRID_SIZE)))
+                elif value == SNAKE_CELL:
+                    segments.append((moves - column_entered[ys[sy]], (px, sy * GRID_SIZE)))
+        surface = self.surface
+        surface.blits(obstacles, doreturn=False)
+        self.profiler.mark('static')
+
+        # Foods and trail pieces are few, so they are culled one by one
+        food_tiles = atlas.foods
+        blits = []
+        for food in engine.foods:
+            if food.position is not None:
+                sx, sy = (food.position[0] - left) % width, (food.position[1] - top) % height
+                if sx < columns and sy < rows:
+                    blits.append((food_tiles[food.food_type], (sx * GRID_SIZE, sy * GRID_SIZE)))
+        surface.blits(blits, doreturn=False)
+        self.profiler.mark('food')
 
-        # Create a safe zone around the snake's starting position
-        safe_zone = []
-        for pos in snake_positions:
-            safe_zone.append(pos)
-            for dx in [-1, 0, 1]:
-                for dy in [-1, 0, 1]:
-                    nx, ny = (pos[0] + dx) % GRID_WIDTH, (pos[1] + dy) % GRID_HEIGHT
-                    safe_zone.append((nx, ny))
-
-        # Generate random obstacles based on difficulty
-        num_obstacles = [3, 5, 8][settings.difficulty]
-
-        for _ in range(num_obstacles):
-            self.generate_obstacle_pattern(safe_zone)
-
-    def generate_obstacle_pattern(self, safe_zone):
-        pattern_type = random.choice(['line', 'cluster', 'maze_piece'])
-
-        if pattern_type == 'line':
-            # Generate a line of obstacles
-            length = random.randint(3, 8)
-            direction = random.choice([(0, 1), (1, 0)])  # Vertical or horizontal
-
-            # Find starting position not in safe zone
-            while True:
-                start_x = random.randint(0, GRID_WIDTH - 1)
-                start_y = random.randint(0, GRID_HEIGHT - 1)
-                if (start_x, start_y) not in safe_zone:
-                    break
-
-            for i in range(length):
-                x = (start_x + direction[0] * i) % GRID_WIDTH
-                y = (start_y + direction[1] * i) % GRID_HEIGHT
-                if (x, y) not in safe_zone:
-                    self.grid[x][y] = 2
-                    self.obstacles.append((x, y))
-
-        elif pattern_type == 'cluster':
-            # Generate a cluster of obstacles
-            while True:
-                center_x = random.randint(0, GRID_WIDTH - 1)
-                center_y = random.randint(0, GRID_HEIGHT - 1)
-                if (center_x, center_y) not in safe_zone:
-                    break
-
-            size = random.randint(3, 5)
-            for _ in range(size):
-                dx = random.randint(-1, 1)
-                dy = random.randint(-1, 1)
-                x = (center_x + dx) % GRID_WIDTH
-                y = (center_y + dy) % GRID_HEIGHT
-                if (x, y) not in safe_zone:
-                    self.grid[x][y] = 2
-                    self.obstacles.append((x, y))
-
-        elif pattern_type == 'maze_piece':
-            # Generate a maze-like piece
-            while True:
-                start_x = random.randint(0, GRID_WIDTH - 3)
-                start_y = random.randint(0, GRID_HEIGHT - 3)
-                valid = True
-                for dx in range(3):
-                    for dy in range(3):
-                        if (start_x + dx, start_y + dy) in safe_zone:
-                            valid = False
-                            break
-                    if not valid:
-                        break
-                if valid:
-                    break
-
-            # Create a small maze piece (C-shape, L-shape, etc.)
-            shape_type = random.randint(0, 3)
-
-            if shape_type == 0:  # C-shape
-                for dx in [0, 1, 2]:
-                    self.grid[(start_x + dx) % GRID_WIDTH][start_y % GRID_HEIGHT] = 2
-                    self.obstacles.append(((start_x + dx) % GRID_WIDTH, start_y % GRID_HEIGHT))
-
-                for dy in [1, 2]:
-                    self.grid[start_x % GRID_WIDTH][(start_y + dy) % GRID_HEIGHT] = 2
-                    self.obstacles.append((start_x % GRID_WIDTH, (start_y + dy) % GRID_HEIGHT))
-
-                for dx in [0, 1, 2]:
-                    self.grid[(start_x + dx) % GRID_WIDTH][(start_y + 2) % GRID_HEIGHT] = 2
-                    self.obstacles.append(((start_x + dx) % GRID_WIDTH, (start_y + 2) % GRID_HEIGHT))
-
-            elif shape_type == 1:  # L-shape
-                for dx in [0, 1, 2]:
-                    self.grid[(start_x + dx) % GRID_WIDTH][start_y % GRID_HEIGHT] = 2
-                    self.obstacles.append(((start_x + dx) % GRID_WIDTH, start_y % GRID_HEIGHT))
-
-                for dy in [1, 2]:
-                    self.grid[start_x % GRID_WIDTH][(start_y + dy) % GRID_HEIGHT] = 2
-                    self.obstacles.append((start_x % GRID_WIDTH, (start_y + dy) % GRID_HEIGHT))
-
-            elif shape_type == 2:  # T-shape
-                for dx in [0, 1, 2]:
-                    self.grid[(start_x + dx) % GRID_WIDTH][start_y % GRID_HEIGHT] = 2
-                    self.obstacles.append(((start_x + dx) % GRID_WIDTH, start_y % GRID_HEIGHT))
-
-                for dy in [1, 2]:
-                    self.grid[(start_x + 1) % GRID_WIDTH][(start_y + dy) % GRID_HEIGHT] = 2
-                    self.obstacles.append(((start_x + 1) % GRID_WIDTH, (start_y + dy) % GRID_HEIGHT))
-
-            else:  # Z-shape
-                for dx in [0, 1]:
-                    self.grid[(start_x + dx) % GRID_WIDTH][start_y % GRID_HEIGHT] = 2
-                    self.obstacles.append(((start_x + dx) % GRID_WIDTH, start_y % GRID_HEIGHT))
-
-                self.grid[(start_x + 1) % GRID_WIDTH][(start_y + 1) % GRID_HEIGHT] = 2
-                self.obstacles.append(((start_x + 1) % GRID_WIDTH, (start_y + 1) % GRID_HEIGHT))
-
-                for dx in [1, 2]:
-                    self.grid[(start_x + dx) % GRID_WIDTH][(start_y + 2) % GRID_HEIGHT] = 2
-                    self.obstacles.append(((start_x + dx) % GRID_WIDTH, (start_y + 2) % GRID_HEIGHT))
-
-    def draw(self, surface, theme_colors):
-        for x, y in self.obstacles:
-            rect = pygame.Rect(
-                x * GRID_SIZE,
-                y * GRID_SIZE,
-                GRID_SIZE,
-                GRID_SIZE
-            )
+        if settings.trail_effect:
+            color = settings.get_theme_colors()['snake_body']
+            get_tile = self.trail_tiles.get
+            blits = []
+            for x, y, alpha in snake.trail.pieces(snake.moves):
+                sx, sy = (x - left) % width, (y - top) % height
+                if sx < columns and sy < rows:
+                    blits.append((get_tile(color, alpha), (sx * GRID_SIZE, sy * GRID_SIZE)))
+            surface.blits(blits, doreturn=False)
+        self.profiler.mark('trail')
+
+        tile = self.body_tile(snake)
+        blits = [(tile(i), position) for i, position in segments if i]
+        blits.append((atlas.heads[snake.direction], self.screen_position(snake.positions[0])))
+        surface.blits(blits, doreturn=False)
+        self.profiler.mark('snake')
+
+# Smallest rect on cell boundaries that covers rect
+def cell_aligned(rect):
+    left = rect.left // GRID_SIZE * GRID_SIZE
+    top = rect.top // GRID_SIZE * GRID_SIZE
+    right = -(-rect.right // GRID_SIZE) * GRID_SIZE
+    bottom = -(-rect.bottom // GRID_SIZE) * GRID_SIZE
+    return pygame.Rect(left, top, right - left, bottom - top)
+
+# Rendered text surfaces, least recently used first. Labels that don't change
+# are rendered once instead of every frame.
+TEXT_CACHE_SIZE = 256
+
+class TextCache:
+    def __init__(self, capacity=TEXT_CACHE_SIZE):
+        self.capacity = capacity
+        self.surfaces = OrderedDict()  # (font, text, color, antialias) -> surface
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, color, antialias=True):
+        key = (font, text, color, antialias)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+
+        self.misses += 1
+        surface = font.render(text, antialias, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.capacity:
+            self.surfaces.popitem(last=False)
+        return surface
+
+# Time from a turn key being handled to the first frame showing the snake's
+# move in the new direction, over the last LATENCY_SAMPLES turns. Keys are
+# timestamped when the event loop reads them, so time spent waiting in the
+# event queue before that (up to a frame) isn't counted.
+LATENCY_SAMPLES = 1000
+
+class InputLatency:
+    def __init__(self, capacity=LATENCY_SAMPLES):
+        self.samples = np.zeros(capacity)  # Milliseconds, ring buffer
+        self.cursor = 0
+        self.count = 0
+
+    def frame_shown(self, input_queue, moves, now):
+        # Call after each display update with the snake's move count
+        applied = input_queue.applied
+        while applied and applied[0][1] <= moves:
+            timestamp, _ = applied.popleft()
+            self.samples[self.cursor] = (now - timestamp) * 1000
+            self.cursor = (self.cursor + 1) % len(self.samples)
+            self.count = min(self.count + 1, len(self.samples))
+
+    def report(self):
+        if self.count == 0:
+            return "Input latency: no turns measured"
+        samples = self.samples[:self.count]
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+        return (f"Input latency over {self.count} turns: mean {samples.mean():.1f} ms, p50 {p50:.1f}, "
+                f"p95 {p95:.1f}, p99 {p99:.1f}, max {samples.max():.1f} ms")
+
+# Decides which frames get drawn. The simulation catches up on missed ticks by
+# itself, but only MAX_CATCH_UP_TICKS at a time, so frames that keep running
+# over budget would slow the game down. Once frames fall behind, the next ones
+# only update (up to FRAME_SKIP_LIMIT in a row) until they are back on time.
+FRAME_SKIP_LIMIT = 4
+
+class FramePacer:
+    def __init__(self, fps=FPS):
+        self.budget = 1.0 / (fps or FPS)  # Uncapped frames are still held to the normal budget
+        self.behind = 0.0  # Seconds of frame time over budget not yet made up
+        self.skipped = 0  # Frames skipped in a row
+        self.dropped = 0  # Frames skipped in total
+
+    def should_draw(self):
+        if self.behind > self.budget and self.skipped < FRAME_SKIP_LIMIT:
+            self.skipped += 1
+            self.dropped += 1
+            return False
+        self.skipped = 0
+        return True
 
-            if settings.theme == 0:  # Classic concrete blocks
-                pygame.draw.rect(surface, theme_colors['obstacle'], rect)
-                pygame.draw.rect(surface, get_gradient_color(theme_colors['obstacle'], BLACK, 0.3), rect, 1)
-
-                # Add brick pattern
-                for i in range(2):
-                    line_y = y * GRID_SIZE + (i + 1) * GRID_SIZE // 3
-                    pygame.draw.line(surface, get_gradient_color(theme_colors['obstacle'], BLACK, 0.3),
-                                    (x * GRID_SIZE, line_y),
-                                    ((x + 1) * GRID_SIZE, line_y), 1)
-
-                if x % 2 == 0:
-                    line_x = x * GRID_SIZE + GRID_SIZE // 2
-                    pygame.draw.line(surface, get_gradient_color(theme_colors['obstacle'], BLACK, 0.3),
-                                    (line_x, y * GRID_SIZE),
-                                    (line_x, (y + 1) * GRID_SIZE), 1)
-
-            elif settings.theme == 1:  # Neon barriers
-                border_width = 2
-                pygame.draw.rect(surface, theme_colors['obstacle'], rect)
-
-                inner_rect = pygame.Rect(
-                    x * GRID_SIZE + border_width,
-                    y * GRID_SIZE + border_width,
-                    GRID_SIZE - 2 * border_width,
-                    GRID_SIZE - 2 * border_width
-                )
-                pygame.draw.rect(surface, get_gradient_color(theme_colors['obstacle'], WHITE, 0.2), inner_rect)
-
-                # Add pulsing effect
-                glow = abs(math.sin(time.time() * 3)) * 50
-                glow_color = get_gradient_color(theme_colors['obstacle'], WHITE, 0.7)
-                pygame.draw.rect(surface, glow_color, rect, 1)
-
-            elif settings.theme == 2:  # Space asteroids
-                # Draw rocky asteroid
-                pygame.draw.rect(surface, theme_colors['obstacle'], rect, border_radius=int(GRID_SIZE/3))
-
-                # Add crater details
-                center_x = x * GRID_SIZE + GRID_SIZE // 2
-                center_y = y * GRID_SIZE + GRID_SIZE // 2
-                pygame.draw.circle(surface, get_gradient_color(theme_colors['obstacle'], BLACK, 0.3),
-                                  (center_x - 3, center_y - 3), GRID_SIZE // 6)
-                pygame.draw.circle(surface, get_gradient_color(theme_colors['obstacle'], BLACK, 0.3),
-                                  (center_x + 4, center_y + 2), GRID_SIZE // 8)
-
-            else:  # Underwater coral
-                pygame.draw.rect(surface, theme_colors['obstacle'], rect, border_radius=int(GRID_SIZE/4))
-
-                # Add coral-like details
-                for i in range(3):
-                    detail_x = x * GRID_SIZE + i * GRID_SIZE // 3 + GRID_SIZE // 6
-                    pygame.draw.line(surface, get_gradient_color(theme_colors['obstacle'], WHITE, 0.2),
-                                    (detail_x, y * GRID_SIZE + GRID_SIZE),
-                                    (detail_x, y * GRID_SIZE + GRID_SIZE // 2), 2)
-
-# Game class
+    def frame_done(self, seconds):
+        # Time the frame's work took, not counting the wait for the next frame
+        self.behind = max(0.0, self.behind + seconds - self.budget)
+
+def load_font(size):
+    # pygame's default font, or Arial from the system if that can't be loaded
+    try:
+        return pygame.font.Font(None, size)
+    except (pygame.error, OSError):
+        print("Warning: Default font not found, using system font")
+        return pygame.font.SysFont('Arial', size)
+
+# Game class. Only what the first menu frame needs is set up in __init__; the
+# engine (board, food and obstacles), fonts and animated backgrounds are made
+# on first use.
 class Game:
-    def __init__(self):
+    def __init__(self, screen, seed=None, dirty_rects=False, board_size=None, smooth=True):
+        self.screen = screen
+        self.seed = seed
+        self.smooth = smooth  # Slide the snake between cells instead of jumping a cell per move
+        self.board_size = board_size or (GRID_WIDTH, GRID_HEIGHT)  # Bigger than the screen scrolls
+        self.dirty_rects = dirty_rects  # Redraw only what changed when the theme allows it
+        self.particle_bounds = None
         self.state = MENU
-        self.snake = Snake()
-        self.food = Food(self.snake.grid, self.snake.positions)
-        self.obstacles = ObstacleGenerator(self.snake.grid, self.snake.positions)
-        self.grid = Grid()
-        self.particle_system = ParticleSystem()
+        self.profiler = FrameProfiler()
+        self.renderer = PygameRenderer(screen, self.profiler)
+        self.particle_system = ParticleSystem()  # Replaced by a seeded one for each game
+        self.recorder = None
+        self.replay_player = None
+        self.autopilot = None  # Steers the snake in attract mode
+        self.input_queue = None  # The player's turns, while they are steering
+        self.latency = InputLatency()
         self.high_score = 0
         self.last_score = 0
         self.game_over_time = 0
+        self.now = time.time()  # Wall clock for animations, read once per frame
+        self.text_cache = TextCache()
+        self.score_label = None  # (score, color, surface) of the HUD score
 
-        # Create stars or bubbles for background
-        self.stars = [Star() for _ in range(100)]
-        self.bubbles = [Bubble() for _ in range(50)]
+    @cached_property
+    def engine(self):
+        return SnakeEngine(settings, *self.board_size, seed=self.seed)
 
-        # Attempt to load font
-        try:
-            self.font = pygame.font.Font(None, 36)
-            self.small_font = pygame.font.Font(None, 24)
-            self.large_font = pygame.font.Font(None, 72)
-        except:
-            print("Warning: Default font not found, using system font")
-            self.font = pygame.font.SysFont('Arial', 36)
-            self.small_font = pygame.font.SysFont('Arial', 24)
-            self.large_font = pygame.font.SysFont('Arial', 72)
+    # Stars or bubbles for the Space and Underwater backgrounds
+    @cached_property
+    def stars(self):
+        return Starfield()
+
+    @cached_property
+    def bubbles(self):
+        return BubbleField()
+
+    @cached_property
+    def font(self):
+        return load_font(36)
+
+    @cached_property
+    def small_font(self):
+        return load_font(24)
+
+    @cached_property
+    def large_font(self):
+        return load_font(72)
+
+    @cached_property
+    def profiler_font(self):
+        return pygame.font.Font(None, 20)
+
+    @property
+    def snake(self):
+        return self.engine.snake
 
     def reset(self):
-        self.snake.reset()
-        self.food = Food(self.snake.grid, self.snake.positions)
-        self.obstacles = ObstacleGenerator(self.snake.grid, self.snake.positions)
-        self.particle_system = ParticleSystem()
+        if self.replay_player:
+            # Back to normal play after watching a replay
+            self.engine = SnakeEngine(settings, *self.board_size, seed=self.seed)
+            self.replay_player = None
+        self.autopilot = None
+        self.input_queue = InputQueue()
+        self.engine.input_source = self.input_queue
+
+        self.engine.reset()
+        self.recorder = ReplayRecorder(self.engine)
+        self.engine.recorder = self.recorder
+        self.particle_system = ParticleSystem(self.engine.rng_particles)
+
+    def start_replay(self, replay, speed=1.0):
+        # Watch a recorded game, `speed` times faster than it was played
+        self.engine = SnakeEngine(replay.settings, replay.width, replay.height, clock=ScaledClock(speed))
+        self.engine.max_catch_up_ticks = MAX_CATCH_UP_TICKS * max(1, math.ceil(speed))
+        self.replay_player = ReplayPlayer(replay, self.engine)
+        self.input_queue = None
+        self.recorder = None
+        self.particle_system = ParticleSystem(self.engine.rng_particles)
+        self.state = PLAYING
+
+    def start_autopilot(self, policy='astar'):
+        # Attract mode: a new game steered by an autopilot from snake_autopilot.POLICIES
+        self.state = PLAYING
+        self.reset()
+        self.autopilot = POLICIES[policy]()
+        self.input_queue = None
+        self.engine.input_source = self.autopilot
+
+    def frame_shown(self):
+        # Called right after the display is updated
+        if self.input_queue and self.state == PLAYING:
+            self.latency.frame_shown(self.input_queue, self.snake.moves, time.perf_counter())
+
+    def save_replay(self):
+        if not self.recorder or not settings.save_replays:
+            return
+        replay = self.recorder.finish(self.engine)
+        try:
+            os.makedirs(REPLAY_DIR, exist_ok=True)
+            replay.save(os.path.join(REPLAY_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{replay.seed:016x}.snkr"))
+        except OSError as e:
+            print(f"Warning: could not save replay: {e}")
 
     def update(self):
+        profiler = self.profiler
+        self.now = time.time()
         self.particle_system.update()
+        profiler.mark('update_particles')
 
         # Update stars or bubbles based on theme
         if settings.theme == 2:  # Space theme
-            for star in self.stars:
-                star.update()
+            self.stars.update(self.now)
         elif settings.theme == 3:  # Underwater theme
-            for bubble in self.bubbles:
-                bubble.update()
+            self.bubbles.update(self.now)
+        profiler.mark('update_background')
 
         if self.state == PLAYING:
             # Update snake and check for collisions
-            if not self.snake.update():
+            if not self.engine.update() or (self.replay_player and self.replay_player.finished):
                 self.state = GAME_OVER
-                self.game_over_time = time.time()
+                self.game_over_time = self.now
+                self.save_replay()
                 self.last_score = self.snake.score
-                if self.snake.score > self.high_score:
+                if self.snake.score > self.high_score and not self.autopilot:
                     self.high_score = self.snake.score
+                profiler.mark('update_snake')
                 return
 
-            # Check for food collision
-            if self.snake.check_food_collision(self.food):
-                # Create particles at food location
-                x, y = self.food.position
-                center_x = x * GRID_SIZE + GRID_SIZE // 2
-                center_y = y * GRID_SIZE + GRID_SIZE // 2
+            # Create particles where food was eaten
+            for position, food_type in self.engine.eaten:
+                x, y = self.renderer.screen_position(position)
+                center_x = x + GRID_SIZE // 2
+                center_y = y + GRID_SIZE // 2
 
                 if settings.particle_effects:
                     self.particle_system.add_particles(center_x, center_y, YELLOW, 15)
-
-                # Reset food
-                self.food.reset(self.snake.positions)
+        profiler.mark('update_snake')
 
     def draw(self):
+        # Returns the screen rects that changed, or None if the whole screen was redrawn
+        # (the profiler overlay is translucent, so it needs full redraws underneath)
+        profiler = self.profiler
+        scrolling = self.state in (PLAYING, GAME_OVER) and self.renderer.scrolls(self.engine)
+        smooth = self.smooth and self.state == PLAYING
+        self.renderer.interpolation = self.engine.move_fraction() if smooth else None
+        if (self.dirty_rects and not profiler.enabled and not scrolling and self.state == PLAYING
+                and settings.theme not in ANIMATED_THEMES):
+            return self.draw_changes()
+        self.renderer.drawn_cells = None  # The next draw_changes starts with a full redraw
+
         theme_colors = settings.get_theme_colors()
 
-        # Fill screen with background color
-        screen.fill(theme_colors['background'])
+        # Obstacles are part of the cached background while a game is on screen,
+        # unless the board scrolls and they move with the camera
+        obstacles = self.engine.obstacles if self.state in (PLAYING, GAME_OVER) and not scrolling else None
 
-        # Draw stars or bubbles based on theme
+        # Draw stars or bubbles based on theme, under the grid and obstacles
         if settings.theme == 2:  # Space theme
-            for star in self.stars:
-                star.draw(screen)
+            self.screen.fill(theme_colors['background'])
+            self.stars.draw(self.screen, self.now)
+            profiler.mark('background')
+            self.renderer.draw_static(obstacles, theme_colors, transparent=True)
         elif settings.theme == 3:  # Underwater theme
-            for bubble in self.bubbles:
-                bubble.draw(screen)
-
-        # Draw grid
-        self.grid.draw(screen, theme_colors['grid'])
+            self.screen.fill(theme_colors['background'])
+            self.bubbles.draw(self.screen, self.now)
+            profiler.mark('background')
+            self.renderer.draw_static(obstacles, theme_colors, transparent=True)
+        else:
+            self.renderer.draw_static(obstacles, theme_colors)
+        profiler.mark('static')
 
+        self.renderer.now = self.now
         if self.state == MENU:
             self.draw_menu()
         elif self.state == PLAYING:
             # Draw game elements
-            self.obstacles.draw(screen, theme_colors)
-            self.food.draw(screen, theme_colors)
-            self.snake.draw(screen, theme_colors)
-            self.particle_system.draw(screen)
+            self.renderer.draw(self.engine)
+            self.particle_system.draw(self.screen)
+            profiler.mark('particles')
             self.draw_hud()
         elif self.state == GAME_OVER:
             # Still draw game elements in background
-            self.obstacles.draw(screen, theme_colors)
-            self.food.draw(screen, theme_colors)
-            self.snake.draw(screen, theme_colors)
-            self.particle_system.draw(screen)
+            self.renderer.draw(self.engine)
+            self.particle_system.draw(self.screen)
+            profiler.mark('particles')
 
             # Draw game over screen
             self.draw_game_over()
         elif self.state == SETTINGS:
             self.draw_settings()
+        profiler.mark('hud')
+        self.draw_profiler()
+        return None
+
+    def draw_changes(self):
+        # Playing on a static background: only cells that changed, the HUD band and
+        # the area around particles are redrawn
+        self.renderer.now = self.now
+        bounds = self.particle_system.bounds()
+        if bounds:
+            bounds = cell_aligned(bounds).clip(self.screen.get_rect())
+        regions = [HUD_RECT] + [rect for rect in (self.particle_bounds, bounds) if rect]
+        self.particle_bounds = bounds
+
+        rects = self.renderer.draw_changes(self.engine, regions)
+        if bounds:
+            self.screen.set_clip(bounds)
+            self.particle_system.draw(self.screen)
+            self.screen.set_clip(None)
+        self.profiler.mark('particles')
+        self.draw_hud()
+        self.profiler.mark('hud')
+        return rects
+
+    def draw_profiler(self):
+        if self.profiler.enabled:
+            self.profiler.draw(self.screen, self.profiler_font)
+            self.profiler.mark('overlay')
+
+    def export_profile(self):
+        path = f"profile-{time.strftime('%Y%m%d-%H%M%S')}.csv"
+        try:
+            self.profiler.export_csv(path)
+            print(f"Saved frame profile to {path}")
+        except OSError as e:
+            print(f"Warning: could not save frame profile: {e}")
 
     def draw_hud(self):
         theme_colors = settings.get_theme_colors()
 
         # Draw score
-        score_text = self.font.render(f"Score: {self.snake.score}", True, theme_colors['text'])
-        screen.blit(score_text, (10, 10))
+        # Only re-rendered when the score changes
+        score = self.snake.score
+        if self.score_label is None or self.score_label[:2] != (score, theme_colors['text']):
+            text = self.font.render(f"Score: {score}", True, theme_colors['text'])
+            self.score_label = (score, theme_colors['text'], text)
+        self.screen.blit(self.score_label[2], (10, 10))
 
         # Draw high score
-        high_score_text = self.font.render(f"High Score: {self.high_score}", True, theme_colors['text'])
+        high_score_text = self.text_cache.render(self.font, f"High Score: {self.high_score}", theme_colors['text'])
         high_score_rect = high_score_text.get_rect()
         high_score_rect.topright = (WIDTH - 10, 10)
-        screen.blit(high_score_text, high_score_rect)
+        self.screen.blit(high_score_text, high_score_rect)
 
         # Draw special effect indicator if active
         if self.snake.special_effect:
             effect_name = self.snake.special_effect.replace('_', ' ').title()
-            time_left = max(0, int(self.snake.special_effect_end - time.time()))
-            effect_text = self.small_font.render(f"{effect_name}: {time_left}s", True, YELLOW)
+            time_left = max(0, self.snake.special_effect_ticks // TICK_RATE)
+            effect_text = self.text_cache.render(self.small_font, f"{effect_name}: {time_left}s", YELLOW)
             effect_rect = effect_text.get_rect()
             effect_rect.centerx = WIDTH // 2
             effect_rect.y = 10
-            screen.blit(effect_text, effect_rect)
+            self.screen.blit(effect_text, effect_rect)
 
     def draw_menu(self):
         theme_colors = settings.get_theme_colors()
 
         # Draw title
-        title_text = self.large_font.render("Cosmic Snake Adventure", True, theme_colors['text'])
+        title_text = self.text_cache.render(self.large_font, "Cosmic Snake Adventure", theme_colors['text'])
         title_rect = title_text.get_rect(center=(WIDTH // 2, HEIGHT // 4))
-        screen.blit(title_text, title_rect)
+        self.screen.blit(title_text, title_rect)
 
         # Draw menu options
         options = [
             ("Press SPACE to Play", WIDTH // 2, HEIGHT // 2),
-            ("Press S for Settings", WIDTH // 2, HEIGHT // 2 + 50),
-            (f"High Score: {self.high_score}", WIDTH // 2, HEIGHT // 2 + 100),
-            ("Press ESC to Quit", WIDTH // 2, HEIGHT // 2 + 150)
+            ("Press A for Autopilot", WIDTH // 2, HEIGHT // 2 + 40),
+            ("Press S for Settings", WIDTH // 2, HEIGHT // 2 + 80),
+            (f"High Score: {self.high_score}", WIDTH // 2, HEIGHT // 2 + 120),
+            ("Press ESC to Quit", WIDTH // 2, HEIGHT // 2 + 160)
         ]
 
         for text, x, y in options:
-            text_surface = self.font.render(text, True, theme_colors['text'])
+            text_surface = self.text_cache.render(self.font, text, theme_colors['text'])
             text_rect = text_surface.get_rect(center=(x, y))
-            screen.blit(text_surface, text_rect)
+            self.screen.blit(text_surface, text_rect)
 
         # Draw animated snake in background
-        t = time.time()
+        t = self.now
         snake_body = []
         for i in range(10):
             x = int(WIDTH // 2 + math.sin(t + i * 0.2) * 100)
@@ -845,7 +1289,7 @@ class Game:
             else:
                 color = theme_colors['snake_body']
 
-            pygame.draw.circle(screen, color, (x, y), 10)
+            pygame.draw.circle(self.screen, color, (x, y), 10)
 
     def draw_game_over(self):
         theme_colors = settings.get_theme_colors()
@@ -853,42 +1297,42 @@ class Game:
         # Create semi-transparent overlay
         overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
         overlay.fill((0, 0, 0, 150))
-        screen.blit(overlay, (0, 0))
+        self.screen.blit(overlay, (0, 0))
 
         # Draw game over text
-        game_over_text = self.large_font.render("Game Over", True, RED)
+        game_over_text = self.text_cache.render(self.large_font, "Game Over", RED)
         game_over_rect = game_over_text.get_rect(center=(WIDTH // 2, HEIGHT // 3))
-        screen.blit(game_over_text, game_over_rect)
+        self.screen.blit(game_over_text, game_over_rect)
 
         # Draw score
-        score_text = self.font.render(f"Score: {self.last_score}", True, theme_colors['text'])
+        score_text = self.text_cache.render(self.font, f"Score: {self.last_score}", theme_colors['text'])
         score_rect = score_text.get_rect(center=(WIDTH // 2, HEIGHT // 2))
-        screen.blit(score_text, score_rect)
+        self.screen.blit(score_text, score_rect)
 
         # Draw high score
-        high_score_text = self.font.render(f"High Score: {self.high_score}", True, theme_colors['text'])
+        high_score_text = self.text_cache.render(self.font, f"High Score: {self.high_score}", theme_colors['text'])
         high_score_rect = high_score_text.get_rect(center=(WIDTH // 2, HEIGHT // 2 + 50))
-        screen.blit(high_score_text, high_score_rect)
+        self.screen.blit(high_score_text, high_score_rect)
 
         # Draw restart message with animation
-        if time.time() - self.game_over_time > 1:  # Wait 1 second before showing
-            restart_alpha = int(255 * abs(math.sin(time.time() * 2)))
-            restart_text = self.font.render("Press SPACE to Restart", True, theme_colors['text'])
+        if self.now - self.game_over_time > 1:  # Wait 1 second before showing
+            restart_alpha = int(255 * abs(math.sin(self.now * 2)))
+            restart_text = self.text_cache.render(self.font, "Press SPACE to Restart", theme_colors['text'])
             restart_text.set_alpha(restart_alpha)
             restart_rect = restart_text.get_rect(center=(WIDTH // 2, HEIGHT * 2 // 3))
-            screen.blit(restart_text, restart_rect)
+            self.screen.blit(restart_text, restart_rect)
 
-            menu_text = self.font.render("Press M for Menu", True, theme_colors['text'])
+            menu_text = self.text_cache.render(self.font, "Press M for Menu", theme_colors['text'])
             menu_rect = menu_text.get_rect(center=(WIDTH // 2, HEIGHT * 2 // 3 + 50))
-            screen.blit(menu_text, menu_rect)
+            self.screen.blit(menu_text, menu_rect)
 
     def draw_settings(self):
         theme_colors = settings.get_theme_colors()
 
         # Draw title
-        title_text = self.large_font.render("Settings", True, theme_colors['text'])
+        title_text = self.text_cache.render(self.large_font, "Settings", theme_colors['text'])
         title_rect = title_text.get_rect(center=(WIDTH // 2, 50))
-        screen.blit(title_text, title_rect)
+        self.screen.blit(title_text, title_rect)
 
         # Draw settings options
         settings_options = [
@@ -901,6 +1345,7 @@ class Game:
             ("Particle Effects", "ON" if settings.particle_effects else "OFF", 8),
             ("Background Motion", "ON" if settings.background_motion else "OFF", 9),
             ("Trail Effect", "ON" if settings.trail_effect else "OFF", 10),
+            ("Food Count", str(settings.food_count), 11),
             ("", "Back to Menu (M)", 12)
         ]
 
@@ -911,24 +1356,24 @@ class Game:
             y = y_start + y_step * position
 
             if label:  # Skip label for the back option
-                label_text = self.font.render(label + ":", True, theme_colors['text'])
+                label_text = self.text_cache.render(self.font, label + ":", theme_colors['text'])
                 label_rect = label_text.get_rect(right=WIDTH // 2 - 20, y=y)
-                screen.blit(label_text, label_rect)
+                self.screen.blit(label_text, label_rect)
 
-            value_text = self.font.render(value, True, YELLOW)
+            value_text = self.text_cache.render(self.font, value, YELLOW)
             value_rect = value_text.get_rect(left=WIDTH // 2 + 20, y=y)
-            screen.blit(value_text, value_rect)
+            self.screen.blit(value_text, value_rect)
 
         # Draw indicators for currently selected option
         selected_option = self.get_selected_setting_index()
         if selected_option < len(settings_options) - 1:  # Exclude Back option
             option_y = y_start + y_step * settings_options[selected_option][2]
-            pygame.draw.polygon(screen, theme_colors['snake_head'], [
+            pygame.draw.polygon(self.screen, theme_colors['snake_head'], [
                 (WIDTH // 2 - 40, option_y + 10),
                 (WIDTH // 2 - 55, option_y + 20),
                 (WIDTH // 2 - 40, option_y + 30)
             ])
-            pygame.draw.polygon(screen, theme_colors['snake_head'], [
+            pygame.draw.polygon(self.screen, theme_colors['snake_head'], [
                 (WIDTH // 2 + 10, option_y + 10),
                 (WIDTH // 2 + 25, option_y + 20),
                 (WIDTH // 2 + 10, option_y + 30)
@@ -937,33 +1382,44 @@ class Game:
     def get_selected_setting_index(self):
         # This function determines which setting is currently selected
         # For simplicity, we'll cycle through them based on time
-        return int(time.time() * 0.5) % 10
+        return int(self.now * 0.5) % 11
 
     def handle_event(self, event):
         if event.type == pygame.QUIT:
             return False
 
         if event.type == pygame.KEYDOWN:
+            if event.key == PROFILE_KEY:
+                self.profiler.toggle()
+                return True
+            if event.key == PROFILE_EXPORT_KEY:
+                self.export_profile()
+                return True
+
             if self.state == MENU:
                 if event.key == pygame.K_SPACE:
                     self.state = PLAYING
                     self.reset()
+                elif event.key == pygame.K_a:
+                    self.start_autopilot()
                 elif event.key == pygame.K_s:
                     self.state = SETTINGS
                 elif event.key == pygame.K_ESCAPE:
                     return False
 
             elif self.state == PLAYING:
-                if event.key == pygame.K_UP or event.key == pygame.K_w:
-                    self.snake.change_direction((0, -1))
+                if event.key == pygame.K_ESCAPE:
+                    self.state = MENU
+                elif self.replay_player or self.autopilot:
+                    pass  # The replay or autopilot steers the snake
+                elif event.key == pygame.K_UP or event.key == pygame.K_w:
+                    self.input_queue.push(self.engine, (0, -1))
                 elif event.key == pygame.K_DOWN or event.key == pygame.K_s:
-                    self.snake.change_direction((0, 1))
+                    self.input_queue.push(self.engine, (0, 1))
                 elif event.key == pygame.K_LEFT or event.key == pygame.K_a:
-                    self.snake.change_direction((-1, 0))
+                    self.input_queue.push(self.engine, (-1, 0))
                 elif event.key == pygame.K_RIGHT or event.key == pygame.K_d:
-                    self.snake.change_direction((1, 0))
-                elif event.key == pygame.K_ESCAPE:
-                    self.state = MENU
+                    self.input_queue.push(self.engine, (1, 0))
 
             elif self.state == GAME_OVER:
                 if event.key == pygame.K_SPACE:
@@ -1012,31 +1468,114 @@ class Game:
             settings.background_motion = not settings.background_motion
         elif selected == 8:  # Trail Effect
             settings.trail_effect = not settings.trail_effect
+        elif selected == 9:  # Food Count
+            food_counts = [1, 3, 5]
+            index = food_counts.index(settings.food_count)
+            settings.food_count = food_counts[(index + direction) % len(food_counts)]
 
 # Main game loop
+def report_startup(steps):
+    # Prints the time each startup step took since the previous one; returns
+    # whether the whole startup went over STARTUP_BUDGET
+    last = IMPORT_STARTED
+    for name, end in steps:
+        print(f"{name:<12} {(end - last) * 1000:8.1f} ms")
+        last = end
+    total = last - IMPORT_STARTED
+    over = total > STARTUP_BUDGET
+    print(f"{'total':<12} {total * 1000:8.1f} ms  (budget {STARTUP_BUDGET * 1000:.0f} ms{', OVER' if over else ''})")
+    return over
+
 def main():
-    game = Game()
+    parser = argparse.ArgumentParser(description="Cosmic Snake Adventure")
+    parser.add_argument("--seed", type=int, help="seed for reproducible games")
+    parser.add_argument("--replay", help="watch a recorded game")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed multiplier")
+    parser.add_argument("--full-redraw", action="store_true", help="flip the whole screen every frame")
+    parser.add_argument("--board", type=board_size, help="board size in cells, e.g. 2000x2000 (scrolls when bigger than the screen)")
+    parser.add_argument("--profile", action="store_true", help="start with the frame profiler overlay on (F3 toggles)")
+    parser.add_argument("--autopilot", nargs="?", const="astar", choices=sorted(POLICIES),
+                        help="start a game steered by an autopilot: astar (default) or cycle")
+    parser.add_argument("--latency", action="store_true", help="print keypress-to-move latency on exit")
+    parser.add_argument("--fps", type=int, default=FPS, help=f"frame rate cap, 0 for uncapped (default {FPS})")
+    parser.add_argument("--vsync", action="store_true", help="wait for the display's refresh instead of a frame cap")
+    parser.add_argument("--no-smooth", action="store_true", help="move the snake a whole cell at a time")
+    parser.add_argument("--startup-report", action="store_true",
+                        help=f"time startup up to the first frame, then exit (status 1 over {STARTUP_BUDGET * 1000:.0f} ms)")
+    args = parser.parse_args()
+    startup = [('import', time.perf_counter())]
+
+    # Only the modules the game uses; pygame.init() would also open audio
+    pygame.display.init()
+    pygame.font.init()
+    startup.append(('pygame init', time.perf_counter()))
+    screen = None
+    fps = args.fps
+    if args.vsync:
+        try:
+            screen = pygame.display.set_mode((WIDTH, HEIGHT), pygame.SCALED, vsync=1)
+            fps = 0  # flip() waits for the refresh
+        except pygame.error as e:
+            print(f"Warning: vsync not available: {e}")
+    if screen is None:
+        screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Cosmic Snake Adventure")
+    clock = pygame.time.Clock()
+    startup.append(('display', time.perf_counter()))
+
+    game = Game(screen, seed=args.seed, dirty_rects=not args.full_redraw, board_size=args.board,
+                smooth=not args.no_smooth)
+    if args.replay:
+        game.start_replay(Replay.load(args.replay), args.speed)
+    elif args.autopilot:
+        game.start_autopilot(args.autopilot)
+    startup.append(('game', time.perf_counter()))
+    profiler = game.profiler
+    if args.profile:
+        profiler.toggle()
+    pacer = FramePacer(fps)
     running = True
 
     while running:
+        profiler.begin_frame()
+        frame_start = time.perf_counter()
+
         # Process events
         for event in pygame.event.get():
             if not game.handle_event(event):
                 running = False
+        profiler.mark('events')
 
         # Update game state
         game.update()
 
-        # Draw everything
-        game.draw()
+        # Draw everything, unless the frame is skipped to catch up
+        if pacer.should_draw():
+            dirty = game.draw()
 
-        # Update display
-        pygame.display.flip()
+            # Update display, only the changed parts when the game reports them
+            if dirty is None:
+                pygame.display.flip()
+            else:
+                pygame.display.update(dirty)
+            game.frame_shown()
+            if startup:
+                startup.append(('first frame', time.perf_counter()))
+                if args.startup_report:
+                    over = report_startup(startup)
+                    pygame.quit()
+                    sys.exit(1 if over else 0)
+                startup = None
+        profiler.mark('display')
+        pacer.frame_done(time.perf_counter() - frame_start)
 
         # Control frame rate
-        clock.tick(FPS)
+        clock.tick(fps)
+        profiler.mark('idle')
 
     pygame.quit()
+    if args.latency:
+        print(game.latency.report())
     sys.exit()
 
 if __name__ == "__main__":
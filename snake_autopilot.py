@@ -0,0 +1,484 @@
+"""Autopilots that steer the snake, for attract mode, soak tests and tournaments.
+
+An autopilot drives an engine as its input source (engine.input_source =
+autopilot) and picks a direction once per move, through
+engine.change_direction so the turns are recorded like a player's. It can
+also be called directly as choose_direction(engine), e.g. from run_headless.
+
+    python snake_autopilot.py [GAMES] [WIDTHxHEIGHT] [POLICY]   soak-test the engine with an autopilot
+"""
+import heapq
+from array import array
+
+from snake_engine import DIRECTIONS, EMPTY, OBSTACLE, SNAKE_CELL, Settings, SnakeEngine
+
+ASTAR_MAX_NODES = 100000  # Searches that expand more cells give up and fall back to a safe move
+FLOOD_LIMIT = 5000  # Most cells counted when comparing the room left after a move
+RETRY_MOVES = 8  # Moves to wait before searching again when there was no safe path
+PATIENCE = 1  # Boards' worth of moves without eating before risking a dead end
+SHORTCUT_MARGIN = 3  # Cells kept between the head and the tail on top of pending growth
+SHORTCUT_LENGTH = 0.5  # Fraction of the cycle the snake fills before it stops taking shortcuts
+DETOUR_CELLS = 6  # Longest detour off the cycle to food on a cell it leaves out
+
+def torus_distance(a, b, width, height):
+    dx = abs(a[0] - b[0])
+    dy = abs(a[1] - b[1])
+    return min(dx, width - dx) + min(dy, height - dy)
+
+def is_passable(snake, x, y, moves_ahead):
+    # Can the head be in (x, y) after moves_ahead moves? Body cells free up as
+    # the tail moves on: the segment `place` cells behind the head is gone after
+    # length - place moves, later if the snake is still growing.
+    value = snake.grid.cells[x][y]
+    if value == SNAKE_CELL:
+        place = snake.moves - snake.entered[x][y]
+        return moves_ahead >= len(snake.positions) - place + snake.grow_queue
+    return value != OBSTACLE
+
+class Autopilot:
+    def __init__(self):
+        self.decided = None  # (snake, move) the current direction was chosen for
+
+    def before_tick(self, engine):
+        # Choose once per move, right after the previous one
+        snake = engine.snake
+        if self.decided != (id(snake), snake.moves):
+            self.decided = (id(snake), snake.moves)
+            engine.change_direction(self.choose_direction(engine))
+
+    def choose_direction(self, engine):
+        raise NotImplementedError
+
+    def safe_direction(self, engine):
+        # No plan: take the move that leaves the most room, or carry on if none is safe
+        snake = engine.snake
+        head = snake.positions[0]
+        best, best_room = snake.direction, -1
+        for direction in DIRECTIONS:
+            if direction[0] + snake.direction[0] == 0 and direction[1] + snake.direction[1] == 0:
+                continue  # Can't turn back on itself
+            x, y = (head[0] + direction[0]) % snake.width, (head[1] + direction[1]) % snake.height
+            if not is_passable(snake, x, y, 1):
+                continue
+            room = self.room(snake, (x, y), min(len(snake.positions) + 1, FLOOD_LIMIT))
+            if room > best_room:
+                best, best_room = direction, room
+        return best
+
+    def room(self, snake, start, limit, moves_ahead=1, neck=None):
+        # Cells reachable from start, where the head is moves_ahead moves from
+        # now, counting up to limit. The neck, the cell the head came from,
+        # can't be gone back through.
+        width, height = snake.width, snake.height
+        seen = {start, neck}
+        frontier = [start]
+        while frontier and len(seen) <= limit:  # seen holds the neck too
+            moves_ahead += 1
+            next_frontier = []
+            for x, y in frontier:
+                for dx, dy in DIRECTIONS:
+                    cell = ((x + dx) % width, (y + dy) % height)
+                    if cell not in seen and is_passable(snake, cell[0], cell[1], moves_ahead):
+                        seen.add(cell)
+                        next_frontier.append(cell)
+            frontier = next_frontier
+        return len(seen) - 1
+
+# Follows the shortest path to the nearest food, found with A* on the
+# wraparound board. The path is kept and followed until the food moves or the
+# next step turns out to be blocked, so most moves cost no search at all.
+class AStarAutopilot(Autopilot):
+    def __init__(self, max_nodes=ASTAR_MAX_NODES):
+        super().__init__()
+        self.max_nodes = max_nodes
+        self.searches = 0
+        self.forget(None)
+
+    def forget(self, snake):
+        self.snake = snake
+        self.path = []  # Cells still to visit, next one last
+        self.target = None
+        self.retry_at = 0  # Move to search again on after finding no safe path
+        self.score = 0
+        self.last_meal = 0  # Move the score last went up on
+
+    def watch(self, snake):
+        if snake is not self.snake:
+            self.forget(snake)  # New game
+        if snake.score != self.score:
+            self.score = snake.score
+            self.last_meal = snake.moves
+
+    def starving(self, snake):
+        return snake.moves - self.last_meal > PATIENCE * snake.width * snake.height
+
+    def choose_direction(self, engine):
+        snake = engine.snake
+        self.watch(snake)
+        width, height = snake.width, snake.height
+        head = snake.positions[0]
+
+        target = self.nearest_food(engine)
+        if target != self.target:
+            self.target = target
+            self.path = []
+            self.retry_at = snake.moves
+        if target and snake.moves >= self.retry_at and (
+                not self.path or not self.follows(head, self.path[-1], width, height)):
+            self.plan(snake, head)
+
+        if self.path:
+            x, y = self.path[-1]
+            if is_passable(snake, x, y, 1):
+                self.path.pop()
+                dx = (x - head[0] + 1) % width - 1
+                dy = (y - head[1] + 1) % height - 1
+                return (dx, dy)
+            self.path = []
+        return self.safe_direction(engine)
+
+    def plan(self, snake, head):
+        self.searches += 1
+        self.path = self.find_path(snake, head, self.target, snake.direction)
+        if self.path and not self.starving(snake) and not self.has_way_out(snake):
+            self.path = []  # The food is in a dead end the snake won't fit in
+        if not self.path:
+            self.retry_at = snake.moves + RETRY_MOVES
+
+    def has_way_out(self, snake):
+        # After eating, the snake (one longer) must have room to keep moving.
+        # Counted as if it got to the food by the shortest route; apart from
+        # the neck, the cells the path itself fills are not accounted for.
+        length = len(snake.positions) + snake.grow_queue + 1
+        limit = min(length, FLOOD_LIMIT)
+        neck = self.path[1] if len(self.path) > 1 else snake.positions[0]
+        return self.room(snake, self.path[0], limit, len(self.path), neck) >= limit
+
+    def follows(self, head, cell, width, height):
+        return torus_distance(head, cell, width, height) == 1
+
+    def nearest_food(self, engine):
+        snake = engine.snake
+        head = snake.positions[0]
+        foods = [food.position for food in engine.foods if food.position is not None]
+        if not foods:
+            return None
+        return min(foods, key=lambda pos: torus_distance(head, pos, snake.width, snake.height))
+
+    def find_path(self, snake, start, goal, direction):
+        # A* with the wraparound Manhattan distance as heuristic. Returns the
+        # cells after start up to goal, last first, or [] if there is no way
+        # there within max_nodes expansions. The first step can't go back
+        # against direction.
+        width, height = snake.width, snake.height
+        goal_x, goal_y = goal
+        behind = ((start[0] - direction[0]) % width, (start[1] - direction[1]) % height)
+
+        def estimate(x, y):
+            dx = abs(x - goal_x)
+            dy = abs(y - goal_y)
+            return min(dx, width - dx) + min(dy, height - dy)
+
+        cost = {start: 0}
+        parent = {}
+        h = estimate(*start)
+        heap = [(h, h, start)]  # (cost + estimate, estimate, cell); ties go to the cell nearer the goal
+        expanded = 0
+        while heap:
+            f, h, cell = heapq.heappop(heap)
+            g = f - h
+            if g > cost[cell]:
+                continue  # Stale entry
+            if cell == goal:
+                path = []
+                while cell != start:
+                    path.append(cell)
+                    cell = parent[cell]
+                return path
+
+            expanded += 1
+            if expanded > self.max_nodes:
+                break
+            x, y = cell
+            g += 1
+            for dx, dy in DIRECTIONS:
+                nx, ny = (x + dx) % width, (y + dy) % height
+                step = (nx, ny)
+                if g >= cost.get(step, g + 1) or not is_passable(snake, nx, ny, g) or (g == 1 and step == behind):
+                    continue
+                cost[step] = g
+                parent[step] = cell
+                h = estimate(nx, ny)
+                heapq.heappush(heap, (g + h, h, step))
+        return []
+
+def serpentine_cycle(width, height):
+    # A cycle through every cell of the board: up and down the columns below
+    # row 0, then back along row 0. With an odd width the last column ends on
+    # the bottom row, which wraps round to row 0.
+    cycle = []
+    for x in range(width):
+        rows = range(1, height) if x % 2 == 0 else range(height - 1, 0, -1)
+        cycle.extend((x, y) for y in rows)
+    cycle.extend((x, 0) for x in range(width - 1, -1, -1))
+    return cycle
+
+def block_cycle(grid, start):
+    # A cycle around a spanning tree of the 2x2 blocks free of obstacles that
+    # can be reached from start's block. Every block is gone round
+    # anticlockwise, except that a tree edge joins the two blocks' loops, so
+    # the cycle covers all four cells of every block in the tree. Cells in
+    # blocks with an obstacle, and the last column or row of an odd-sized
+    # board, are left out. Returns [] if start's block isn't free.
+    width, height = grid.width, grid.height
+    blocks_x, blocks_y = width // 2, height // 2
+    wrap_x, wrap_y = width % 2 == 0, height % 2 == 0
+    cells = grid.cells
+
+    def is_free(bx, by):
+        x, y = bx * 2, by * 2
+        return OBSTACLE not in (cells[x][y], cells[x + 1][y], cells[x][y + 1], cells[x + 1][y + 1])
+
+    root = (start[0] // 2, start[1] // 2)
+    if root[0] >= blocks_x or root[1] >= blocks_y or not is_free(*root):
+        return []
+
+    # Default step out of each cell of a block, turning anticlockwise on screen
+    step = {(0, 0): (0, 1), (0, 1): (1, 0), (1, 1): (0, -1), (1, 0): (-1, 0)}
+    exits = {}  # Cell -> step, where a tree edge changes the default
+
+    seen = {root}
+    stack = [root]
+    while stack:
+        bx, by = stack.pop()
+        for dx, dy in DIRECTIONS:
+            nx, ny = bx + dx, by + dy
+            if not (0 <= nx < blocks_x or wrap_x) or not (0 <= ny < blocks_y or wrap_y):
+                continue
+            nx, ny = nx % blocks_x, ny % blocks_y
+            if (nx, ny) in seen or not is_free(nx, ny):
+                continue
+            seen.add((nx, ny))
+            stack.append((nx, ny))
+            # Join the loops: going right, the left block leaves from its bottom
+            # right cell and the right block comes back from its top left one;
+            # going down, the upper block leaves from its bottom left cell and
+            # the lower one comes back from its top right
+            (lx, ly), (rx, ry) = ((bx, by), (nx, ny)) if (dx, dy) in ((1, 0), (0, 1)) else ((nx, ny), (bx, by))
+            if dx:
+                exits[(lx * 2 + 1, ly * 2 + 1)] = (1, 0)
+                exits[(rx * 2, ry * 2)] = (-1, 0)
+            else:
+                exits[(lx * 2, ly * 2 + 1)] = (0, 1)
+                exits[(rx * 2 + 1, ry * 2)] = (0, -1)
+
+    cycle = []
+    x, y = root[0] * 2, root[1] * 2
+    for _ in range(len(seen) * 4):
+        cycle.append((x, y))
+        dx, dy = exits.get((x, y)) or step[(x % 2, y % 2)]
+        x, y = (x + dx) % width, (y + dy) % height
+    return cycle
+
+# Follows a cycle through the board, which a snake can do forever without
+# hitting itself, until the snake fills it. The cycle is worked out once per
+# obstacle layout; each move only looks at the head's four neighbours in a
+# table of cycle indexes.
+#
+# The body always lies along the cycle in order, tail to head, so the cells
+# ahead of the head up to the tail are free. A shortcut to a neighbour further
+# along the cycle keeps that true as long as it doesn't pass the tail, with a
+# margin for the growth still to come. Cells a shortcut skips are left behind
+# the head, though, and the tail only frees them when it gets there, so once
+# the snake fills SHORTCUT_LENGTH of the cycle it stops taking shortcuts and
+# detours and just follows the cycle.
+# Food on a cell the cycle leaves out is eaten by a short detour off the cycle
+# that rejoins it the same way. Food no detour reaches, such as in a dead end,
+# is left until the snake starves, and then A* takes over.
+class HamiltonianAutopilot(AStarAutopilot):
+    def __init__(self, max_nodes=ASTAR_MAX_NODES):
+        super().__init__(max_nodes)
+        self.layout = None  # (layout_id, cycle length, index table)
+        self.detour = []  # Cells off the cycle still to visit, next one last
+
+    def cycle_index(self, engine):
+        # Index of every cell along the cycle, -1 for cells it leaves out
+        snake = engine.snake
+        layout_id = engine.obstacles.layout_id
+        if self.layout is None or self.layout[0] != layout_id:
+            width, height = snake.width, snake.height
+            if engine.obstacles.obstacles:
+                cycle = block_cycle(snake.grid, snake.positions[-1])
+            else:
+                cycle = serpentine_cycle(width, height)
+            index = array('l', [-1]) * (width * height)
+            for i, (x, y) in enumerate(cycle):
+                index[x * height + y] = i
+            self.layout = (layout_id, len(cycle), index)
+            self.detour = []
+        return self.layout[1], self.layout[2]
+
+    def choose_direction(self, engine):
+        snake = engine.snake
+        self.watch(snake)
+        width, height = snake.width, snake.height
+        size, index = self.cycle_index(engine)
+        head = snake.positions[0]
+        position = index[head[0] * height + head[1]]
+        if position < 0 or self.starving(snake):
+            if self.detour and self.follows(head, self.detour[-1], width, height):
+                return self.towards(head, self.detour.pop(), width, height)
+            self.detour = []
+            return super().choose_direction(engine)
+        self.detour = []
+
+        # Free cells ahead of the head up to the tail, less room for growth.
+        # Tail segments still on a detour count from the first one back on the cycle.
+        positions = snake.positions
+        tail = -1
+        while index[positions[tail][0] * height + positions[tail][1]] < 0:
+            tail -= 1
+        tail_x, tail_y = positions[tail]
+        ahead = (index[tail_x * height + tail_y] - position) % size or size
+        reach = ahead - snake.grow_queue - SHORTCUT_MARGIN
+        if len(positions) + snake.grow_queue > size * SHORTCUT_LENGTH:
+            reach = 0  # Only the next cell along the cycle
+
+        # Cycle distance to the nearest food, or to a cycle cell next to it
+        goal = size
+        off_cycle = []
+        for food in engine.foods:
+            if food.position is None:
+                continue
+            x, y = food.position
+            target = index[x * height + y]
+            if target >= 0:
+                goal = min(goal, (target - position) % size or size)
+                continue
+            off_cycle.append(food.position)
+            for dx, dy in DIRECTIONS:
+                target = index[(x + dx) % width * height + (y + dy) % height]
+                if target >= 0:
+                    goal = min(goal, (target - position) % size or size)
+
+        # Of the safe moves, go furthest without passing the food, else the least
+        # past it. The next cell along the cycle is always safe.
+        best, best_key = snake.direction, None
+        for direction in DIRECTIONS:
+            if direction[0] + snake.direction[0] == 0 and direction[1] + snake.direction[1] == 0:
+                continue  # Can't turn back on itself
+            x, y = (head[0] + direction[0]) % width, (head[1] + direction[1]) % height
+            target = index[x * height + y]
+            if target < 0:
+                if off_cycle and self.plan_detour(snake, (x, y), off_cycle, position, size, index, reach):
+                    return direction
+                continue
+            distance = (target - position) % size
+            if distance == 1 or 0 < distance < reach:
+                key = distance if distance <= goal else -distance
+                if best_key is None or key > best_key:
+                    best, best_key = direction, key
+        return best
+
+    def plan_detour(self, snake, start, foods, position, size, index, reach):
+        # Look for a way from start, off the cycle, over one of the foods and
+        # back onto the cycle ahead of the head without passing the tail. Only
+        # runs with food within DETOUR_CELLS of start, so it stays cheap.
+        width, height = snake.width, snake.height
+        if all(torus_distance(start, food, width, height) >= DETOUR_CELLS for food in foods):
+            return False
+        path = [start]
+
+        def extend(fed):
+            x, y = path[-1]
+            for dx, dy in DIRECTIONS:
+                cell = ((x + dx) % width, (y + dy) % height)
+                target = index[cell[0] * height + cell[1]]
+                if target >= 0:
+                    if fed and 0 < (target - position) % size < reach - len(path):
+                        path.append(cell)
+                        return True
+                elif (len(path) < DETOUR_CELLS and cell not in path
+                      and is_passable(snake, cell[0], cell[1], len(path) + 1)):
+                    path.append(cell)
+                    if extend(fed or cell in foods):
+                        return True
+                    path.pop()
+            return False
+
+        if not is_passable(snake, start[0], start[1], 1) or not extend(start in foods):
+            return False
+        path.reverse()
+        path.pop()  # start is taken this move
+        self.detour = path  # Ends back on the cycle
+        return True
+
+    def towards(self, head, cell, width, height):
+        return ((cell[0] - head[0] + 1) % width - 1, (cell[1] - head[1] + 1) % height - 1)
+
+POLICIES = {'astar': AStarAutopilot, 'cycle': HamiltonianAutopilot}
+
+def check_board(engine):
+    # The board's cells and free-cell counts must agree with the snake, food and obstacles
+    snake = engine.snake
+    grid = snake.grid
+    for x, y in snake.positions:
+        assert grid.cells[x][y] == SNAKE_CELL, f"snake cell {(x, y)} not marked"
+    for x, y in engine.obstacles.obstacles:
+        assert grid.cells[x][y] == OBSTACLE, f"obstacle {(x, y)} not marked"
+    empty = sum(column.count(EMPTY) for column in grid.cells)
+    assert empty == grid.free_count, f"{empty} empty cells but {grid.free_count} counted free"
+    for x, column in enumerate(grid.cells):
+        assert column.count(EMPTY) == grid.column_free[x], f"free count of column {x} is off"
+    for i in range(1, grid.width + 1):
+        expected = sum(grid.column_free[i - (i & -i):i])
+        assert grid.free_tree[i] == expected, f"free tree node {i} is {grid.free_tree[i]}, not {expected}"
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    width, height = (int(n) for n in sys.argv[2].split('x')) if len(sys.argv) > 2 else (40, 30)
+    policy = sys.argv[3] if len(sys.argv) > 3 else 'astar'
+    engine = SnakeEngine(Settings(), width, height, seed=0)
+    autopilot = POLICIES[policy]()
+    max_moves = (width * height) ** 2  # Games past this are stuck, e.g. on food the cycle misses
+
+    start = time.perf_counter()
+    total_moves = 0
+    scores = []
+    lengths = []
+    for game in range(games):
+        engine.reset()
+        while engine.alive and engine.snake.moves < max_moves:
+            engine.change_direction(autopilot.choose_direction(engine))
+            engine.step()
+            if engine.snake.moves % 1000 == 0:
+                check_board(engine)
+        check_board(engine)
+        total_moves += engine.snake.moves
+        scores.append(engine.snake.score)
+        lengths.append(len(engine.snake.positions))
+    elapsed = time.perf_counter() - start
+
+    print(f"{games} {policy} games on {width}x{height}: mean score {sum(scores) / games:.1f}, best {max(scores)}, "
+          f"longest snake {max(lengths)}, "
+          f"{total_moves} moves in {elapsed:.2f}s ({total_moves / elapsed:,.0f} moves/s, "
+          f"{autopilot.searches} searches)")
+
+    if policy == 'cycle':
+        # With no obstacles the cycle covers the whole board, so seed 0 must fill it
+        settings = Settings()
+        settings.obstacles = False
+        engine = SnakeEngine(settings, width, height, seed=0)
+        autopilot = POLICIES[policy]()
+        while engine.alive and len(engine.snake.positions) < width * height and engine.snake.moves < max_moves:
+            engine.change_direction(autopilot.choose_direction(engine))
+            engine.step()
+        check_board(engine)
+        length = len(engine.snake.positions)
+        print(f"Empty {width}x{height} board, seed 0: length {length} of {width * height} "
+              f"after {engine.snake.moves} moves")
+        if length < width * height:
+            sys.exit(1)
@@ -0,0 +1,226 @@
+"""Many Snake games stepped in lockstep with NumPy, for agent training.
+
+Each board follows the same rules as snake_engine.Snake.move and
+check_food_collision (wraparound, self/obstacle collision, tail vacating,
+growth and food respawn) with normal food only. Run this file to check it
+against the scalar engine.
+"""
+import numpy as np
+
+from snake_engine import (
+    GRID_WIDTH, GRID_HEIGHT, EMPTY, SNAKE_CELL, OBSTACLE, FOOD_CELL, DIRECTIONS,
+    Settings, SnakeEngine,
+)
+
+# Direction index -> (dx, dy); opposite directions are two apart
+DX = np.array([d[0] for d in DIRECTIONS], dtype=np.int64)
+DY = np.array([d[1] for d in DIRECTIONS], dtype=np.int64)
+
+class BatchSnakeEnv:
+    def __init__(self, num_envs, width=GRID_WIDTH, height=GRID_HEIGHT, obstacles=(), seed=None, auto_reset=False):
+        self.num_envs = num_envs
+        self.width = width
+        self.height = height
+        self.num_cells = width * height
+        self.auto_reset = auto_reset
+        self.rng = np.random.default_rng(seed)
+        self.rows = np.arange(num_envs)
+
+        # Cells are numbered x * height + y, like in Board
+        self.obstacle_layout = np.zeros(self.num_cells, dtype=np.int8)
+        for x, y in obstacles:
+            self.obstacle_layout[x * height + y] = OBSTACLE
+
+        self.occupancy = np.zeros((num_envs, self.num_cells), dtype=np.int8)
+        # Body cells as a ring buffer per board; head_index points at the head
+        self.body = np.zeros((num_envs, self.num_cells), dtype=np.int64)
+        self.head_index = np.zeros(num_envs, dtype=np.int64)
+        self.length = np.zeros(num_envs, dtype=np.int64)
+        self.grow_queue = np.zeros(num_envs, dtype=np.int64)
+        self.food = np.zeros(num_envs, dtype=np.int64)
+        self.direction = np.zeros(num_envs, dtype=np.int64)
+        self.score = np.zeros(num_envs, dtype=np.int64)
+        self.alive = np.zeros(num_envs, dtype=bool)
+        self.reset()
+
+    def reset(self, mask=None):
+        rows = self.rows if mask is None else np.flatnonzero(mask)
+        if len(rows) == 0:
+            return
+
+        start = (self.width // 2) * self.height + self.height // 2
+        self.occupancy[rows] = self.obstacle_layout
+        self.occupancy[rows, start] = SNAKE_CELL
+        self.body[rows, 0] = start
+        self.head_index[rows] = 0
+        self.length[rows] = 1
+        self.grow_queue[rows] = 0
+        self.direction[rows] = self.rng.integers(0, 4, size=len(rows))
+        self.score[rows] = 0
+        self.alive[rows] = True
+        self.spawn_food(rows)
+
+    def spawn_food(self, rows):
+        # Uniformly random free cell per board: random keys, occupied cells masked out
+        keys = self.rng.random((len(rows), self.num_cells))
+        keys[self.occupancy[rows] != EMPTY] = -1.0
+        cells = keys.argmax(axis=1)
+        has_room = keys[np.arange(len(rows)), cells] >= 0
+
+        self.food[rows] = np.where(has_room, cells, -1)
+        self.occupancy[rows[has_room], cells[has_room]] = FOOD_CELL
+
+    def step(self, actions=None):
+        # actions: direction index per board (0-3), or -1 to keep going straight.
+        # Returns (rewards, dones) for this step.
+        rewards = np.zeros(self.num_envs, dtype=np.int64)
+        dones = np.zeros(self.num_envs, dtype=bool)
+
+        if actions is not None:
+            actions = np.asarray(actions, dtype=np.int64)
+            # Prevent 180 degree turns, same as Snake.change_direction
+            turn = (actions >= 0) & (actions != (self.direction + 2) % 4)
+            self.direction = np.where(turn, actions, self.direction)
+
+        rows = np.flatnonzero(self.alive)
+        if len(rows) == 0:
+            return rewards, dones
+
+        head = self.body[rows, self.head_index[rows]]
+        direction = self.direction[rows]
+        new_x = (head // self.height + DX[direction]) % self.width
+        new_y = (head % self.height + DY[direction]) % self.height
+        new_head = new_x * self.height + new_y
+
+        tail_index = (self.head_index[rows] - self.length[rows] + 1) % self.num_cells
+        tail = self.body[rows, tail_index]
+        growing = self.grow_queue[rows] > 0
+
+        # The tail cell is about to be vacated unless the snake is growing this move
+        target = self.occupancy[rows, new_head]
+        blocked = (target == OBSTACLE) | ((target == SNAKE_CELL) & (growing | (new_head != tail)))
+
+        dead = rows[blocked]
+        self.alive[dead] = False
+        dones[dead] = True
+
+        moving = ~blocked
+        rows, new_head, tail, growing = rows[moving], new_head[moving], tail[moving], growing[moving]
+
+        self.grow_queue[rows] -= growing
+        self.length[rows] += growing
+        shrinking = ~growing
+        self.occupancy[rows[shrinking], tail[shrinking]] = EMPTY
+
+        self.head_index[rows] = (self.head_index[rows] + 1) % self.num_cells
+        self.body[rows, self.head_index[rows]] = new_head
+        self.occupancy[rows, new_head] = SNAKE_CELL
+
+        # Eat food and respawn it
+        ate = rows[new_head == self.food[rows]]
+        self.score[ate] += 1
+        self.grow_queue[ate] += 1
+        rewards[ate] = 1
+        if len(ate):
+            self.spawn_food(ate)
+
+        if self.auto_reset and len(dead):
+            self.reset(dones)
+
+        return rewards, dones
+
+    def positions(self, env):
+        # Body of one board as (x, y) tuples, head first
+        indices = (self.head_index[env] - np.arange(self.length[env])) % self.num_cells
+        return [(int(c) // self.height, int(c) % self.height) for c in self.body[env, indices]]
+
+    def food_position(self, env):
+        cell = int(self.food[env])
+        if cell < 0:
+            return None
+        return (cell // self.height, cell % self.height)
+
+def _place_food(food, position):
+    # Move a scalar Food onto a chosen cell so both engines see the same board
+    grid = food.grid
+    if food.position is not None and grid.get(food.position) == FOOD_CELL:
+        grid.set(food.position, EMPTY)
+    food.food_type = 'normal'
+    food.value = 1
+    food.growth = 1
+    food.position = position
+    if position is not None:
+        assert grid.is_free(position), f"batch placed food on a taken cell {position}"
+        grid.set(position, FOOD_CELL)
+
+def parity_check(num_envs=64, steps=2000, width=12, height=10, seed=0):
+    # Step the batch engine and one scalar SnakeEngine per board with the same
+    # moves and food placements, and check that every board stays identical.
+    settings = Settings()
+    settings.special_foods = False
+    settings.obstacles = False
+    settings.trail_effect = False
+    settings.food_count = 1
+
+    obstacles = [(1, 1), (1, 2), (width - 2, height - 3)]
+    batch = BatchSnakeEnv(num_envs, width, height, obstacles=obstacles, seed=seed)
+    rng = np.random.default_rng(seed + 1)
+
+    def sync(env, engine):
+        engine.reset()
+        for pos in obstacles:
+            engine.obstacles.place_obstacle(*pos)
+        engine.snake.direction = DIRECTIONS[batch.direction[env]]
+        _place_food(engine.foods[0], batch.food_position(env))
+
+    engines = [SnakeEngine(settings, width, height) for _ in range(num_envs)]
+    for env, engine in enumerate(engines):
+        sync(env, engine)
+
+    for step in range(steps):
+        actions = rng.integers(-1, 4, size=num_envs)
+        _, dones = batch.step(actions)
+
+        for env, engine in enumerate(engines):
+            if not engine.alive:
+                continue
+            if actions[env] >= 0:
+                engine.snake.change_direction(DIRECTIONS[actions[env]])
+            alive = engine.step()
+            assert alive == (not dones[env]), f"env {env} step {step}: alive {alive} vs batch {not dones[env]}"
+            if not alive:
+                continue
+            if engine.eaten:
+                _place_food(engine.foods[0], batch.food_position(env))
+
+            snake = engine.snake
+            assert list(snake.positions) == batch.positions(env), f"env {env} step {step}: body differs"
+            assert snake.score == batch.score[env], f"env {env} step {step}: score differs"
+            assert snake.grow_queue == batch.grow_queue[env], f"env {env} step {step}: grow queue differs"
+            cells = np.array(snake.grid.cells, dtype=np.int8).reshape(-1)
+            assert np.array_equal(cells, batch.occupancy[env]), f"env {env} step {step}: occupancy differs"
+
+        # Restart finished games on both sides
+        if not batch.alive.all():
+            dead = ~batch.alive
+            batch.reset(dead)
+            for env in np.flatnonzero(dead):
+                sync(env, engines[env])
+
+    return True
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    parity_check()
+    print("parity check passed")
+
+    num_envs = int(sys.argv[1]) if len(sys.argv) > 1 else 4096
+    env = BatchSnakeEnv(num_envs, seed=0, auto_reset=True)
+    steps = 200
+    start = time.perf_counter()
+    for _ in range(steps):
+        env.step(env.rng.integers(-1, 4, size=num_envs))
+    elapsed = time.perf_counter() - start
+    print(f"{num_envs} boards x {steps} steps in {elapsed:.2f}s ({num_envs * steps / elapsed:,.0f} moves/s)")
@@ -0,0 +1,244 @@
+"""Benchmarks for the Snake hot paths, at board sizes from 40x30 up to 1000x1000.
+
+Each case is timed for at least --min-time seconds per repeat and the best
+time per operation is kept, so numbers are stable enough to compare runs.
+
+    python snake_bench.py run [--out FILE] [--quick] [--only TEXT]   run the suite, optionally save a JSON baseline
+    python snake_bench.py compare BASELINE CURRENT [--threshold 0.1] flag cases that got slower than the threshold
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+from snake_autopilot import serpentine_cycle
+from snake_engine import EMPTY, SNAKE_CELL, Settings, SnakeEngine
+
+BOARD_SIZES = [(40, 30), (100, 100), (250, 250), (1000, 1000)]
+SNAKE_LENGTHS = [10, 500, 10000, 200000]
+PARTICLE_COUNTS = [100, 1000, 10000, 50000]
+
+QUICK_BOARD_SIZES = [(40, 30), (100, 100)]
+QUICK_SNAKE_LENGTHS = [10, 500]
+QUICK_PARTICLE_COUNTS = [1000, 10000]
+
+MIN_TIME = 0.2
+REPEATS = 3
+THRESHOLD = 0.10  # Slowdown ratio compare reports as a regression
+
+class SnakeOnCycle:
+    # An engine whose snake has the given length and follows a cycle through the
+    # whole board, so it can keep moving for as long as the benchmark needs
+    def __init__(self, width, height, length, seed=0):
+        settings = Settings()
+        settings.special_foods = False
+        self.settings = settings
+        self.engine = engine = SnakeEngine(settings, width, height, seed=seed)
+
+        # Start from an empty board
+        grid = engine.snake.grid
+        for pos in engine.obstacles.obstacles:
+            grid.set(pos, EMPTY)
+        engine.obstacles.obstacles = []
+        for food in engine.foods:
+            grid.set(food.position, EMPTY)
+        for pos in engine.snake.positions:
+            grid.set(pos, EMPTY)
+
+        cycle = serpentine_cycle(width, height)
+        self.next_direction = [None] * (width * height)
+        for (x, y), (nx, ny) in zip(cycle, cycle[1:] + cycle[:1]):
+            self.next_direction[x * height + y] = (nx - x, ny - y)
+
+        snake = engine.snake
+        snake.positions.clear()
+        for i, (x, y) in enumerate(cycle[:length]):
+            snake.positions.appendleft((x, y))
+            grid.set((x, y), SNAKE_CELL)
+            snake.entered[x][y] = i - (length - 1)  # The head entered on move 0
+        for food in engine.foods:
+            food.position = None
+            food.reset()
+
+    def step(self):
+        engine = self.engine
+        x, y = engine.snake.positions[0]
+        engine.snake.direction = self.next_direction[x * engine.height + y]
+        engine.step()
+
+def measure(operation, min_time=MIN_TIME, repeats=REPEATS):
+    # Best seconds per call of operation over the repeats, each running for at
+    # least min_time; a single slow call counts as a whole repeat. One untimed
+    # call first fills any caches.
+    operation()
+    best = None
+    total_calls = 0
+    for _ in range(repeats):
+        calls = 0
+        start = time.perf_counter()
+        elapsed = 0.0
+        batch = 1
+        while elapsed < min_time:
+            for _ in range(batch):
+                operation()
+            calls += batch
+            batch *= 2
+            elapsed = time.perf_counter() - start
+        per_call = elapsed / calls
+        best = per_call if best is None else min(best, per_call)
+        total_calls += calls
+        if elapsed > 5 * min_time:
+            break  # Too slow to repeat
+    return best, total_calls
+
+def engine_cases(boards, lengths):
+    # (name, setup) pairs for everything that needs a board with a snake on it
+    for width, height in boards:
+        for length in lengths:
+            if length > width * height // 2:
+                continue
+            yield f"{width}x{height}/len{length}", (width, height, length)
+
+def run(boards, lengths, particle_counts, only=None, min_time=MIN_TIME, repeats=REPEATS):
+    results = {}
+
+    def record(name, operation):
+        if only and only not in name:
+            return
+        per_call, calls = measure(operation, min_time, repeats)
+        results[name] = {'us_per_op': per_call * 1e6, 'ops': calls}
+        print(f"{name:<45} {per_call * 1e6:12.2f} us/op  ({calls} ops)", flush=True)
+
+    game = None
+    for label, (width, height, length) in engine_cases(boards, lengths):
+        names = [f"{bench}/{label}" for bench in ('snake_step', 'food_reset', 'generate_obstacles', 'game_draw')]
+        if only and not any(only in name for name in names):
+            continue
+
+        board = SnakeOnCycle(width, height, length)
+        engine = board.engine
+        record(names[0], board.step)
+        record(names[1], engine.foods[0].reset)
+
+        board.settings.obstacles = True
+        record(names[2], lambda: engine.obstacles.generate_obstacles(engine.snake.positions))
+
+        if not only or only in names[3]:
+            if game is None:
+                game = offscreen_game()
+            game.engine = engine
+            record(names[3], game.draw)
+
+    for count in particle_counts:
+        name = f"particle_update/{count}"
+        if only and only not in name:
+            continue
+        record(name, particles(count).update)
+
+    return results
+
+def offscreen_game():
+    os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+    import pygame
+    import Snake_Game
+
+    pygame.font.init()
+    game = Snake_Game.Game(pygame.Surface((Snake_Game.WIDTH, Snake_Game.HEIGHT)), seed=0)
+    game.state = Snake_Game.PLAYING
+    return game
+
+def particles(count):
+    os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+    import Snake_Game
+
+    system = Snake_Game.ParticleSystem(capacity=max(count, 1))
+    while system.count < count:
+        system.add_particles(400, 300, Snake_Game.YELLOW, min(1000, count - system.count))
+    # Keep every particle alive so each update works on the same count
+    system.lifespan[:count] = 2 ** 30
+    system.size[:count] = 1e9
+    return system
+
+def environment():
+    import numpy as np
+    info = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    try:
+        import pygame
+        info['pygame'] = pygame.version.ver
+    except ImportError:
+        pass
+    return info
+
+def compare(baseline, current, threshold=THRESHOLD):
+    # Prints old and new time per case; returns the names that got slower than threshold
+    regressions = []
+    print(f"{'case':<45} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, base in baseline['results'].items():
+        result = current['results'].get(name)
+        if result is None:
+            continue
+        ratio = result['us_per_op'] / base['us_per_op'] if base['us_per_op'] else 1.0
+        if ratio > 1 + threshold:
+            status = "REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            status = "faster"
+        else:
+            status = ""
+        print(f"{name:<45} {base['us_per_op']:12.2f} {result['us_per_op']:12.2f} {ratio - 1:+8.1%} {status}")
+
+    missing = sorted(set(baseline['results']) - set(current['results']))
+    if missing:
+        print(f"{len(missing)} baseline cases were not run: {', '.join(missing)}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Snake benchmarks")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="run the benchmarks")
+    run_parser.add_argument('--out', help="save results as a JSON baseline")
+    run_parser.add_argument('--quick', action='store_true', help="small boards only")
+    run_parser.add_argument('--only', help="run cases whose name contains this text")
+    run_parser.add_argument('--min-time', type=float, default=MIN_TIME, help="seconds per repeat")
+    run_parser.add_argument('--repeats', type=int, default=REPEATS)
+
+    compare_parser = commands.add_parser('compare', help="compare two result files")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                                help="slowdown ratio that counts as a regression (0.1 = 10%%)")
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        if args.quick:
+            boards, lengths, counts = QUICK_BOARD_SIZES, QUICK_SNAKE_LENGTHS, QUICK_PARTICLE_COUNTS
+        else:
+            boards, lengths, counts = BOARD_SIZES, SNAKE_LENGTHS, PARTICLE_COUNTS
+        results = run(boards, lengths, counts, args.only, args.min_time, args.repeats)
+        if args.out:
+            with open(args.out, 'w') as f:
+                json.dump({'environment': environment(), 'results': results}, f, indent=2)
+            print(f"Saved {len(results)} results to {args.out}")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    regressions = compare(baseline, current, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} regressions beyond {args.threshold:.0%}")
+        return 1
+    print("No regressions")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,929 @@
+"""Game rules for Cosmic Snake Adventure, with no pygame or display dependency.
+
+Snake_Game.py draws this state with pygame; anything that only needs the
+rules (servers, bots, tools) can import this module on its own.
+"""
+import argparse
+import itertools
+import os
+import random
+import time
+from array import array
+from collections import deque
+from types import MappingProxyType
+
+# Default board size (matches the 800x600 window with 20px cells)
+GRID_WIDTH = 40
+GRID_HEIGHT = 30
+MIN_BOARD_SIZE = 3  # Smallest board width or height
+FREE_CELL_TRIES = 4  # Random cells tried before searching for a free one by rank
+
+# Board cell states
+EMPTY = 0
+SNAKE_CELL = 1
+OBSTACLE = 2
+FOOD_CELL = 3
+
+DIRECTIONS = [(1, 0), (0, 1), (-1, 0), (0, -1)]
+
+# The simulation advances in fixed ticks; speeds and effect durations are counted in ticks
+TICK_RATE = 60
+EFFECT_TICKS = 5 * TICK_RATE  # Special effects last 5 seconds
+MAX_CATCH_UP_TICKS = 10  # Most ticks one real-time update will run after a stall
+INPUT_QUEUE_SIZE = 3  # Turns a player can queue ahead of the snake
+
+# Speed multipliers for special effects, in halves so tick maths stays in integers
+EFFECT_SPEED_HALVES = {
+    None: 2,
+    'speed_boost': 3,
+    'slow_motion': 1,
+}
+
+# Independent random streams, so e.g. particle effects never change where food appears
+RNG_SNAKE = 0
+RNG_FOOD = 1
+RNG_OBSTACLES = 2
+RNG_PARTICLES = 3
+
+MASK64 = (1 << 64) - 1
+
+# Trail pieces start half transparent and fade out over TRAIL_MOVES moves
+TRAIL_START_ALPHA = 128
+TRAIL_FADE = 5
+TRAIL_MOVES = 26
+TRAIL_CAPACITY = 512
+
+# Obstacle generation gives up on a pattern after this many tries at finding a
+# spot for it, and only blocks a cell if its open neighbours still meet within
+# CONNECTIVITY_RADIUS cells of it, so the open part of the board never splits
+OBSTACLE_ATTEMPTS = 32
+CONNECTIVITY_RADIUS = 4
+
+# The 8 cells around a cell in order round it, starting above it
+RING = [(0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1)]
+
+# Every obstacle layout gets a new id, so renderers know when to redraw it
+_layout_ids = itertools.count(1)
+
+# Seeded random stream (SplitMix64). The whole state is one 64-bit integer,
+# so it is cheap to copy, compare and save, and the same seed gives the same
+# numbers on every platform.
+class RngStream(random.Random):
+    def __init__(self, seed=None, stream=0):
+        self.stream = stream
+        super().__init__(seed)
+
+    def seed(self, a=None, version=2):
+        if a is None:
+            a = int.from_bytes(os.urandom(8), 'little')
+        self.state = (a * 0x9E3779B97F4A7C15 + self.stream * 0xD1B54A32D192ED03) & MASK64
+        self.gauss_next = None
+
+    def next64(self):
+        self.state = z = (self.state + 0x9E3779B97F4A7C15) & MASK64
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK64
+        return z ^ (z >> 31)
+
+    def random(self):
+        return (self.next64() >> 11) * (1.0 / 9007199254740992.0)
+
+    def getrandbits(self, k):
+        if k <= 64:
+            return self.next64() >> (64 - k)
+        bits = 0
+        for shift in range(0, k, 64):
+            bits |= self.next64() << shift
+        return bits & ((1 << k) - 1)
+
+    def getstate(self):
+        return self.state
+
+    def setstate(self, state):
+        self.state = state
+
+# Clocks for driving the simulation in real time
+class SystemClock:
+    def now(self):
+        return time.perf_counter()
+
+# Clock that only moves when told to, for tests and replays
+class ManualClock:
+    def __init__(self, start=0.0):
+        self.time = start
+
+    def now(self):
+        return self.time
+
+    def advance(self, seconds):
+        self.time += seconds
+
+# Clock that runs `speed` times faster (or slower) than another clock
+class ScaledClock:
+    def __init__(self, speed, base=None):
+        self.speed = speed
+        self.base = base or SystemClock()
+        self.start = self.base.now()
+
+    def now(self):
+        return self.start + (self.base.now() - self.start) * self.speed
+
+# Settings
+class Settings:
+    def __init__(self):
+        self.difficulty = 1  # 0: Easy, 1: Medium, 2: Hard
+        self.theme = 0  # 0: Classic, 1: Neon, 2: Space, 3: Underwater
+        self.snake_style = 0  # 0: Classic, 1: Gradient, 2: Patterned, 3: Glowing
+        self.special_foods = True
+        self.obstacles = True
+        self.grid_visible = True
+        self.particle_effects = True
+        self.background_motion = True
+        self.trail_effect = True
+        self.food_count = 1  # Number of foods on the board at once (feast mode above 1)
+        self.save_replays = True  # The game saves a replay of every finished game
+
+    def get_speed(self):
+        speeds = [6, 10, 15]
+        return speeds[self.difficulty]
+
+    def get_theme_colors(self):
+        return THEME_PALETTES[self.theme]
+
+    def get_color_ramp(self):
+        return COLOR_RAMPS[(self.theme, self.snake_style)]
+
+# Function to create a gradient effect
+def get_gradient_color(color1, color2, ratio):
+    return (
+        int(color1[0] * (1 - ratio) + color2[0] * ratio),
+        int(color1[1] * (1 - ratio) + color2[1] * ratio),
+        int(color1[2] * (1 - ratio) + color2[2] * ratio)
+    )
+
+THEME_COLORS = [
+    {  # Classic
+        'background': (50, 50, 50),
+        'grid': (70, 70, 70),
+        'snake_head': (0, 200, 0),
+        'snake_body': (0, 255, 0),
+        'food': (255, 0, 0),
+        'special_food': (255, 215, 0),
+        'obstacle': (128, 128, 128),
+        'text': (255, 255, 255),
+    },
+    {  # Neon
+        'background': (10, 10, 30),
+        'grid': (30, 30, 50),
+        'snake_head': (255, 0, 255),
+        'snake_body': (0, 255, 255),
+        'food': (255, 255, 0),
+        'special_food': (255, 128, 0),
+        'obstacle': (150, 0, 255),
+        'text': (0, 255, 255),
+    },
+    {  # Space
+        'background': (5, 5, 20),
+        'grid': (15, 15, 40),
+        'snake_head': (200, 200, 255),
+        'snake_body': (150, 150, 255),
+        'food': (255, 100, 100),
+        'special_food': (255, 200, 50),
+        'obstacle': (100, 50, 150),
+        'text': (200, 200, 255),
+    },
+    {  # Underwater
+        'background': (0, 50, 100),
+        'grid': (0, 70, 120),
+        'snake_head': (0, 255, 200),
+        'snake_body': (0, 200, 255),
+        'food': (255, 50, 50),
+        'special_food': (255, 200, 0),
+        'obstacle': (50, 100, 150),
+        'text': (200, 255, 255),
+    },
+]
+
+# A theme's colors plus the shades derived from them, computed once and read-only
+def compile_palette(colors):
+    palette = dict(colors)
+    palette['obstacle_shadow'] = get_gradient_color(colors['obstacle'], (0, 0, 0), 0.3)
+    palette['obstacle_highlight'] = get_gradient_color(colors['obstacle'], (255, 255, 255), 0.2)
+    palette['obstacle_glow'] = get_gradient_color(colors['obstacle'], (255, 255, 255), 0.7)
+    return MappingProxyType(palette)
+
+THEME_PALETTES = tuple(compile_palette(colors) for colors in THEME_COLORS)
+
+# Body colors for each (theme, snake style), so a segment's color is a table lookup
+RAMP_STEPS = 64
+
+def compile_color_ramp(palette, snake_style):
+    head_color = palette['snake_head']
+    body_color = palette['snake_body']
+    if snake_style == 0:  # Classic
+        return (body_color,)
+    elif snake_style == 1:  # Gradient, indexed by position along the body
+        return tuple(get_gradient_color(head_color, body_color, i / (RAMP_STEPS - 1)) for i in range(RAMP_STEPS))
+    elif snake_style == 2:  # Patterned, indexed by segment parity
+        return (body_color, head_color)
+    else:  # Glowing, indexed by pulse
+        return tuple(get_gradient_color(body_color, head_color, i / (RAMP_STEPS - 1)) for i in range(RAMP_STEPS))
+
+COLOR_RAMPS = {(theme, snake_style): compile_color_ramp(palette, snake_style)
+               for theme, palette in enumerate(THEME_PALETTES) for snake_style in range(4)}
+
+# Board occupancy with an index of free cells. Everything is stored in flat
+# byte and integer arrays, so boards of millions of cells stay small and quick
+# to create.
+class Board:
+    def __init__(self, width=GRID_WIDTH, height=GRID_HEIGHT):
+        self.width = width
+        self.height = height
+        self.cells = [bytearray(height) for _ in range(width)]  # All EMPTY
+
+        # Free cells are counted per column, with a Fenwick tree over the counts
+        # so both updating a count and finding the column holding the k-th free
+        # cell take O(log width). Sampling picks the k-th free cell in column
+        # order, so which cell comes up depends only on which cells are free and
+        # not on the order they were freed in: a board rebuilt from a saved game
+        # samples exactly like the original.
+        self.column_free = array('l', [height]) * width
+        self.free_count = width * height
+        # Node i holds the free cells of the i & -i columns ending at column i - 1
+        self.free_tree = array('l', [height * (i & -i) for i in range(width + 1)])
+        self.tree_step = 1 << (width.bit_length() - 1)  # Largest power of two <= width
+
+    def __getitem__(self, x):
+        return self.cells[x]
+
+    def get(self, pos):
+        return self.cells[pos[0]][pos[1]]
+
+    def set(self, pos, value):
+        x, y = pos
+        old = self.cells[x][y]
+        if old == value:
+            return
+        self.cells[x][y] = value
+        if old == EMPTY:
+            change = -1
+        elif value == EMPTY:
+            change = 1
+        else:
+            return
+        self.column_free[x] += change
+        self.free_count += change
+        tree = self.free_tree
+        width = self.width
+        i = x + 1
+        while i <= width:
+            tree[i] += change
+            i += i & -i
+
+    def set_many(self, positions, value):
+        # set() for a lot of cells at once: the free counts are worked out again
+        # once at the end, in O(width) rather than O(log width) per cell
+        cells = self.cells
+        for x, y in positions:
+            cells[x][y] = value
+        self.column_free = array('l', [column.count(EMPTY) for column in cells])
+        self.free_count = sum(self.column_free)
+        tree = self.free_tree
+        width = self.width
+        tree[1:] = self.column_free
+        for i in range(1, width + 1):
+            parent = i + (i & -i)
+            if parent <= width:
+                tree[parent] += tree[i]
+
+    def is_free(self, pos):
+        return self.cells[pos[0]][pos[1]] == EMPTY
+
+    def random_free_cell(self, rng):
+        if not self.free_count:
+            return None
+
+        # First try a few cells drawn from the whole board. Unless the board is
+        # nearly full one of them is usually free, which settles it in O(1); only
+        # a miss falls back to the k-th free cell. Either way every free cell is
+        # equally likely.
+        cells = self.width * self.height
+        for _ in range(FREE_CELL_TRIES):
+            x, y = divmod(rng.randrange(cells), self.height)
+            if self.cells[x][y] == EMPTY:
+                return x, y
+        k = rng.randrange(self.free_count)
+
+        # Walk down the tree to the column, then binary search the row, counting
+        # free cells only in the half being ruled out so the column is read once
+        tree = self.free_tree
+        width = self.width
+        x = 0
+        step = self.tree_step
+        while step:
+            if x + step <= width and tree[x + step] <= k:
+                x += step
+                k -= tree[x]
+            step >>= 1
+        column = self.cells[x]
+        low, high = 0, self.height - 1
+        while low < high:
+            middle = (low + high) // 2
+            free = column.count(EMPTY, low, middle + 1)
+            if free > k:
+                high = middle
+            else:
+                low = middle + 1
+                k -= free
+        return x, low
+
+# Fading trail behind the snake, kept in fixed-size ring buffers of
+# positions and birth moves so nothing is allocated as it updates
+class Trail:
+    def __init__(self, capacity=TRAIL_CAPACITY):
+        self.capacity = capacity
+        self.xs = [0] * capacity
+        self.ys = [0] * capacity
+        self.born = [0] * capacity
+        self.start = 0
+        self.count = 0
+
+    def clear(self):
+        self.start = 0
+        self.count = 0
+
+    def push(self, pos, move):
+        if self.count == self.capacity:
+            # Full: overwrite the oldest piece
+            self.start = (self.start + 1) % self.capacity
+            self.count -= 1
+        i = (self.start + self.count) % self.capacity
+        self.xs[i], self.ys[i] = pos
+        self.born[i] = move
+        self.count += 1
+
+    def expire(self, move):
+        # Pieces are pushed in move order, so faded ones are always at the start
+        while self.count and move - self.born[self.start] >= TRAIL_MOVES:
+            self.start = (self.start + 1) % self.capacity
+            self.count -= 1
+
+    def pieces(self, move):
+        # (x, y, alpha) of every live piece, oldest first
+        for n in range(self.count):
+            i = (self.start + n) % self.capacity
+            yield self.xs[i], self.ys[i], TRAIL_START_ALPHA - TRAIL_FADE * (move - self.born[i])
+
+# Snake class
+class Snake:
+    def __init__(self, settings, width=GRID_WIDTH, height=GRID_HEIGHT, rng=None):
+        self.settings = settings
+        self.width = width
+        self.height = height
+        self.reset(rng)
+
+    def reset(self, rng=None):
+        rng = rng or random
+        self.length = 3
+        self.positions = deque([(self.width // 2, self.height // 2)])
+        self.direction = rng.choice(DIRECTIONS)
+        self.score = 0
+        self.grid = Board(self.width, self.height)
+        for pos in self.positions:
+            self.grid.set(pos, SNAKE_CELL)
+        # Move on which the head entered each cell, so the segment in a cell is
+        # moves - entered[x][y] places behind the head without walking the body
+        self.entered = [array('l', [0]) * self.height for _ in range(self.width)]
+        self.move_progress = 0  # Half-moves accumulated towards the next move
+        self.moves = 0
+        self.special_effect = None
+        self.special_effect_ticks = 0
+        self.grow_queue = 0
+        self.trail = Trail()
+        self.death_cause = None  # 'self' or 'obstacle' once the snake has crashed
+        self.vacated = None  # Cell the tail left on the last move, None if the snake grew
+
+    def is_free(self, pos):
+        return self.grid.is_free(pos)
+
+    def is_blocked(self, pos):
+        # The tail cell is about to be vacated unless the snake is growing this move
+        cell = self.grid.get(pos)
+        if cell == SNAKE_CELL:
+            return self.grow_queue > 0 or pos != self.positions[-1]
+        return cell == OBSTACLE
+
+    def tick(self):
+        # Advance one simulation tick, moving when enough progress has built up
+        if self.special_effect:
+            self.special_effect_ticks -= 1
+            if self.special_effect_ticks <= 0:
+                self.special_effect = None
+
+        self.move_progress += self.settings.get_speed() * EFFECT_SPEED_HALVES[self.special_effect]
+        if self.move_progress >= TICK_RATE * 2:
+            self.move_progress -= TICK_RATE * 2
+            return self.move()
+        return True
+
+    def move(self):
+        # Update trail if enabled
+        if self.settings.trail_effect:
+            move = self.moves + 1
+            self.trail.expire(move)
+
+            # Add every other body position to the trail. Pieces further than
+            # TRAIL_MOVES from the tail fade out before the body uncovers them,
+            # so only the end of the body needs adding.
+            positions = self.positions
+            first = max(0, len(positions) - TRAIL_MOVES)
+            for i in range(first + first % 2, len(positions), 2):
+                self.trail.push(positions[i], move)
+
+        # Calculate new head position
+        head = self.positions[0]
+        new_head = ((head[0] + self.direction[0]) % self.width,
+                    (head[1] + self.direction[1]) % self.height)
+
+        # Check if the snake hit itself or an obstacle
+        if self.is_blocked(new_head):
+            self.death_cause = 'obstacle' if self.grid.get(new_head) == OBSTACLE else 'self'
+            return False
+
+        # Check if we need to grow the snake
+        if self.grow_queue > 0:
+            self.grow_queue -= 1
+            self.vacated = None
+        else:
+            # Remove the tail if not growing
+            self.vacated = self.positions.pop()
+            self.grid.set(self.vacated, EMPTY)
+
+        # Add the new head to the front of the body
+        self.positions.appendleft(new_head)
+        self.grid.set(new_head, SNAKE_CELL)
+        self.moves += 1
+        self.entered[new_head[0]][new_head[1]] = self.moves
+
+        return True
+
+    def grow(self, amount=1):
+        self.grow_queue += amount
+
+    def check_food_collision(self, food):
+        if self.positions[0] == food.position:
+            self.score += food.value
+            self.grow(food.growth)
+
+            # Apply special effects based on food type
+            if food.food_type == 'speed_boost':
+                self.special_effect = 'speed_boost'
+                self.special_effect_ticks = EFFECT_TICKS
+            elif food.food_type == 'slow_motion':
+                self.special_effect = 'slow_motion'
+                self.special_effect_ticks = EFFECT_TICKS
+
+            return True
+        return False
+
+    def change_direction(self, new_direction):
+        # Prevent 180 degree turns
+        if (self.direction[0] + new_direction[0] != 0 or
+            self.direction[1] + new_direction[1] != 0):
+            self.direction = new_direction
+
+# Food class
+class Food:
+    def __init__(self, grid, settings, rng=None):
+        self.grid = grid
+        self.settings = settings
+        self.rng = rng or random
+        self.position = None
+        self.reset()
+
+    def reset(self):
+        # Release the old cell unless the snake has already moved onto it
+        if self.position is not None and self.grid.get(self.position) == FOOD_CELL:
+            self.grid.set(self.position, EMPTY)
+
+        # Select food type
+        rng = self.rng
+        if self.settings.special_foods and rng.random() < 0.2:  # 20% chance for special food
+            self.set_type(rng.choice(['normal', 'bonus', 'speed_boost', 'slow_motion']))
+        else:
+            self.set_type('normal')
+
+        # Pick a random free cell from the board's index
+        position = self.grid.random_free_cell(rng)
+        if position is not None:
+            self.position = position
+            self.grid.set(position, FOOD_CELL)
+        else:
+            # If no positions available, just pick a random spot (game is likely almost over anyway)
+            self.position = (rng.randint(0, self.grid.width - 1), rng.randint(0, self.grid.height - 1))
+
+    def place(self, position, food_type):
+        # Put food of the given type on a cell, e.g. when restoring a saved game
+        if self.position is not None and self.grid.get(self.position) == FOOD_CELL:
+            self.grid.set(self.position, EMPTY)
+        self.set_type(food_type)
+        self.position = position
+        if position is not None and self.grid.is_free(position):
+            self.grid.set(position, FOOD_CELL)
+
+    def set_type(self, food_type):
+        # Set properties based on food type
+        self.food_type = food_type
+        if self.food_type == 'normal':
+            self.value = 1
+            self.growth = 1
+        elif self.food_type == 'bonus':
+            self.value = 5
+            self.growth = 2
+        elif self.food_type == 'speed_boost':
+            self.value = 2
+            self.growth = 1
+        elif self.food_type == 'slow_motion':
+            self.value = 2
+            self.growth = 1
+
+# Obstacle generator
+class ObstacleGenerator:
+    def __init__(self, grid, snake_positions, settings, rng=None):
+        self.grid = grid
+        self.settings = settings
+        self.rng = rng or random
+        self.obstacles = []
+        self.layout_id = next(_layout_ids)
+        self.generate_obstacles(snake_positions)
+
+    def generate_obstacles(self, snake_positions, num_patterns=None):
+        if not self.settings.obstacles:
+            return
+
+        width, height = self.grid.width, self.grid.height
+
+        # Clear previous obstacles
+        for pos in self.obstacles:
+            self.grid.set(pos, EMPTY)
+
+        self.obstacles = []
+        self.layout_id = next(_layout_ids)
+
+        # Create a safe zone around the snake's starting position
+        safe_zone = set()
+        for pos in snake_positions:
+            for dx in [-1, 0, 1]:
+                for dy in [-1, 0, 1]:
+                    safe_zone.add(((pos[0] + dx) % width, (pos[1] + dy) % height))
+
+        # Generate random obstacles based on difficulty, more on boards bigger than the default
+        if num_patterns is None:
+            scale = max(1, (width * height) // (GRID_WIDTH * GRID_HEIGHT))
+            num_patterns = [3, 5, 8][self.settings.difficulty] * scale
+
+        for _ in range(num_patterns):
+            self.generate_obstacle_pattern(safe_zone)
+
+    def place_obstacle(self, x, y):
+        if self.grid[x][y] == OBSTACLE:
+            return
+        self.grid.set((x, y), OBSTACLE)
+        self.obstacles.append((x, y))
+        self.layout_id = next(_layout_ids)
+
+    def place_obstacles(self, cells):
+        # Place many obstacles as one layout change, e.g. when restoring a saved game
+        for x, y in cells:
+            if self.grid[x][y] != OBSTACLE:
+                self.grid.set((x, y), OBSTACLE)
+                self.obstacles.append((x, y))
+        self.layout_id = next(_layout_ids)
+
+    def add_obstacle(self, x, y, safe_zone):
+        # Place an obstacle from a pattern, unless the cell is taken, in the safe
+        # zone, or would cut the open cells around it off from each other
+        if (x, y) in safe_zone or not self.grid.is_free((x, y)) or not self.keeps_connected(x, y):
+            return
+        self.place_obstacle(x, y)
+
+    def keeps_connected(self, x, y):
+        # If the open neighbours of (x, y) can still reach each other once it is
+        # blocked, every path through it can go around, so the board stays in one
+        # piece. Only a window around the cell is searched: that can turn down a
+        # cell that was fine, but never lets one through that splits the board.
+        width, height = self.grid.width, self.grid.height
+        cells = self.grid.cells
+        radius = CONNECTIVITY_RADIUS
+
+        def is_open(dx, dy):
+            cx, cy = (x + dx) % width, (y + dy) % height
+            return (cx, cy) != (x, y) and cells[cx][cy] != OBSTACLE
+
+        neighbours = [d for d in DIRECTIONS if is_open(*d)]
+        if len(neighbours) <= 1:
+            return True
+
+        # Quick check first: walking round the 8 cells around (x, y), each cell
+        # touches the next, so neighbours in one unbroken open run are connected
+        ring = [is_open(dx, dy) for dx, dy in RING]
+        if all(ring):
+            return True
+        start = ring.index(False)
+        runs = set()
+        run = 0
+        for i in range(start, start + 8):
+            if not ring[i % 8]:
+                run += 1
+            elif i % 2 == 0:  # Even ring places are the four neighbours
+                runs.add(run)
+        if len(runs) == 1:
+            return True
+
+        targets = set(neighbours[1:])
+        seen = {(0, 0), neighbours[0]}
+        queue = [neighbours[0]]
+        for cx, cy in queue:
+            for dx, dy in DIRECTIONS:
+                step = (cx + dx, cy + dy)
+                if step in seen or abs(step[0]) > radius or abs(step[1]) > radius:
+                    continue
+                seen.add(step)
+                if not is_open(*step):
+                    continue
+                targets.discard(step)
+                if not targets:
+                    return True
+                queue.append(step)
+        return False
+
+    def find_start(self, safe_zone, size=1):
+        # A random free cell whose size x size block is clear of the safe zone,
+        # or None after OBSTACLE_ATTEMPTS tries
+        width, height = self.grid.width, self.grid.height
+        for _ in range(OBSTACLE_ATTEMPTS):
+            pos = self.grid.random_free_cell(self.rng)
+            if pos is None:
+                return None
+            if all(((pos[0] + dx) % width, (pos[1] + dy) % height) not in safe_zone
+                   for dx in range(size) for dy in range(size)):
+                return pos
+        return None
+
+    def generate_obstacle_pattern(self, safe_zone):
+        width, height = self.grid.width, self.grid.height
+        rng = self.rng
+        pattern_type = rng.choice(['line', 'cluster', 'maze_piece'])
+
+        if pattern_type == 'line':
+            # Generate a line of obstacles
+            length = rng.randint(3, 8)
+            direction = rng.choice([(0, 1), (1, 0)])  # Vertical or horizontal
+
+            # Find starting position not in safe zone
+            start = self.find_start(safe_zone)
+            if start is None:
+                return
+            start_x, start_y = start
+
+            for i in range(length):
+                x = (start_x + direction[0] * i) % width
+                y = (start_y + direction[1] * i) % height
+                self.add_obstacle(x, y, safe_zone)
+
+        elif pattern_type == 'cluster':
+            # Generate a cluster of obstacles
+            center = self.find_start(safe_zone)
+            if center is None:
+                return
+            center_x, center_y = center
+
+            size = rng.randint(3, 5)
+            for _ in range(size):
+                dx = rng.randint(-1, 1)
+                dy = rng.randint(-1, 1)
+                x = (center_x + dx) % width
+                y = (center_y + dy) % height
+                self.add_obstacle(x, y, safe_zone)
+
+        elif pattern_type == 'maze_piece':
+            # Generate a maze-like piece in a 3x3 block clear of the safe zone
+            start = self.find_start(safe_zone, 3)
+            if start is None:
+                return
+            start_x, start_y = start
+
+            # Create a small maze piece (C-shape, L-shape, etc.)
+            shape_type = rng.randint(0, 3)
+
+            if shape_type == 0:  # C-shape
+                for dx in [0, 1, 2]:
+                    self.add_obstacle((start_x + dx) % width, start_y % height, safe_zone)
+
+                for dy in [1, 2]:
+                    self.add_obstacle(start_x % width, (start_y + dy) % height, safe_zone)
+
+                for dx in [0, 1, 2]:
+                    self.add_obstacle((start_x + dx) % width, (start_y + 2) % height, safe_zone)
+
+            elif shape_type == 1:  # L-shape
+                for dx in [0, 1, 2]:
+                    self.add_obstacle((start_x + dx) % width, start_y % height, safe_zone)
+
+                for dy in [1, 2]:
+                    self.add_obstacle(start_x % width, (start_y + dy) % height, safe_zone)
+
+            elif shape_type == 2:  # T-shape
+                for dx in [0, 1, 2]:
+                    self.add_obstacle((start_x + dx) % width, start_y % height, safe_zone)
+
+                for dy in [1, 2]:
+                    self.add_obstacle((start_x + 1) % width, (start_y + dy) % height, safe_zone)
+
+            else:  # Z-shape
+                for dx in [0, 1]:
+                    self.add_obstacle((start_x + dx) % width, start_y % height, safe_zone)
+
+                self.add_obstacle((start_x + 1) % width, (start_y + 1) % height, safe_zone)
+
+                for dx in [1, 2]:
+                    self.add_obstacle((start_x + dx) % width, (start_y + 2) % height, safe_zone)
+
+# Board, snake, food and obstacles for one game, with scoring and effects.
+# The game advances in fixed ticks: tick() runs one, update() runs as many as
+# the clock says are due, and fast_forward() runs them as fast as possible.
+# With the same seed and the same inputs on the same ticks, every run plays out
+# identically.
+class SnakeEngine:
+    def __init__(self, settings=None, width=GRID_WIDTH, height=GRID_HEIGHT, seed=None, clock=None):
+        self.settings = settings or Settings()
+        self.width = width
+        self.height = height
+        self.clock = clock or SystemClock()
+        self.seeds = RngStream(seed)
+        self.recorder = None  # Gets record(tick, direction) for every turn taken
+        self.input_source = None  # Gets before_tick(engine) ahead of every tick
+        self.max_catch_up_ticks = MAX_CATCH_UP_TICKS
+        self.reset()
+
+    def reset(self, seed=None):
+        # Each game gets its own seed, drawn from the engine's seed unless given
+        self.seed = self.seeds.getrandbits(64) if seed is None else seed
+        self.rng_snake = RngStream(self.seed, RNG_SNAKE)
+        self.rng_food = RngStream(self.seed, RNG_FOOD)
+        self.rng_obstacles = RngStream(self.seed, RNG_OBSTACLES)
+        self.rng_particles = RngStream(self.seed, RNG_PARTICLES)
+
+        self.snake = Snake(self.settings, self.width, self.height, self.rng_snake)
+        self.obstacles = ObstacleGenerator(self.snake.grid, self.snake.positions, self.settings, self.rng_obstacles)
+        self.foods = [Food(self.snake.grid, self.settings, self.rng_food) for _ in range(self.settings.food_count)]
+        self.ticks = 0
+        self.alive = True
+        self.eaten = []  # (position, food_type) of foods eaten on the last update
+        self.last_time = None
+        self.accumulator = 0.0
+
+    def change_direction(self, direction):
+        old_direction = self.snake.direction
+        self.snake.change_direction(direction)
+        if self.recorder is not None and self.snake.direction != old_direction:
+            self.recorder.record(self.ticks, self.snake.direction)
+
+    def tick(self):
+        if self.input_source is not None:
+            self.input_source.before_tick(self)
+        self.ticks += 1
+        if not self.snake.tick():
+            self.alive = False
+            return False
+        self.check_foods()
+        return True
+
+    def update(self):
+        # Run the ticks that are due by the clock, at most max_catch_up_ticks at once
+        self.eaten = []
+        now = self.clock.now()
+        if self.last_time is None:
+            self.last_time = now
+        self.accumulator += now - self.last_time
+        self.last_time = now
+
+        tick_time = 1.0 / TICK_RATE
+        ticks = 0
+        while self.accumulator >= tick_time:
+            self.accumulator -= tick_time
+            if not self.tick():
+                return False
+            ticks += 1
+            if ticks >= self.max_catch_up_ticks:
+                self.accumulator = 0.0
+                break
+        return True
+
+    def move_fraction(self):
+        # How far the snake has got toward its next move, from 0 to 1, counting
+        # the time since the last tick, for drawing it between cells
+        snake = self.snake
+        per_tick = self.settings.get_speed() * EFFECT_SPEED_HALVES[snake.special_effect]
+        progress = snake.move_progress + per_tick * min(self.accumulator * TICK_RATE, 1.0)
+        return min(progress / (TICK_RATE * 2), 1.0)
+
+    def step(self):
+        # Tick until the snake moves one cell
+        self.eaten = []
+        moves = self.snake.moves
+        while self.snake.moves == moves:
+            if not self.tick():
+                return False
+        return True
+
+    def fast_forward(self, ticks):
+        # Run up to `ticks` ticks without the clock; stops early if the snake dies
+        self.eaten = []
+        for _ in range(ticks):
+            if not self.tick():
+                return False
+        return True
+
+    def check_foods(self):
+        for food in self.foods:
+            if self.snake.check_food_collision(food):
+                self.eaten.append((food.position, food.food_type))
+                food.reset()
+
+# Player turns waiting for the snake; attach with engine.input_source = InputQueue().
+# Turns are applied one per move, so two quick presses between moves (a U-turn)
+# take two moves instead of the second overwriting the first. A turn that
+# wouldn't change the direction the snake will have by then is dropped, and so
+# is any turn past INPUT_QUEUE_SIZE.
+class InputQueue:
+    def __init__(self, size=INPUT_QUEUE_SIZE):
+        self.turns = deque()  # (direction, timestamp) waiting
+        self.size = size
+        self.last_direction = None  # Direction after the last queued turn
+        self.turn_move = None  # Snake move count when the last turn was applied
+        self.applied = deque(maxlen=64)  # (timestamp, move) of applied turns, for latency
+
+    def push(self, engine, direction, timestamp=None):
+        # Queue a turn; returns whether it was kept
+        current = self.last_direction if self.turns else engine.snake.direction
+        if (len(self.turns) >= self.size or direction == current or
+                (direction[0] + current[0] == 0 and direction[1] + current[1] == 0)):
+            return False
+        self.turns.append((direction, time.perf_counter() if timestamp is None else timestamp))
+        self.last_direction = direction
+        return True
+
+    def before_tick(self, engine):
+        snake = engine.snake
+        if not self.turns or snake.moves == self.turn_move:
+            return  # Nothing waiting, or this move already has its turn
+        direction, timestamp = self.turns.popleft()
+        engine.change_direction(direction)
+        self.turn_move = snake.moves
+        self.applied.append((timestamp, snake.moves + 1))  # Shows once the snake has moved
+
+# Renderer interface; Snake_Game.PygameRenderer draws to a window
+class Renderer:
+    def draw(self, engine):
+        raise NotImplementedError
+
+# Renderer that draws nothing, for running the rules headless
+class NullRenderer(Renderer):
+    def draw(self, engine):
+        pass
+
+def run_headless(engine, moves, choose_direction=None, renderer=None):
+    # Play up to `moves` moves as fast as possible, restarting on death.
+    # Returns the number of games that ended.
+    renderer = renderer or NullRenderer()
+    games = 0
+    for _ in range(moves):
+        if choose_direction is not None:
+            engine.change_direction(choose_direction(engine))
+        if not engine.step():
+            games += 1
+            engine.reset()
+        renderer.draw(engine)
+    return games
+
+def board_size(text):
+    # argparse type for a WIDTHxHEIGHT board size, shared by the command-line tools
+    try:
+        width, height = (int(n) for n in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WIDTHxHEIGHT, got {text!r}")
+    if width < MIN_BOARD_SIZE or height < MIN_BOARD_SIZE:
+        raise argparse.ArgumentTypeError(f"the board must be at least {MIN_BOARD_SIZE}x{MIN_BOARD_SIZE}")
+    return width, height
+
+if __name__ == "__main__":
+    import sys
+
+    moves = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    engine = SnakeEngine(seed=0)
+    turns = RngStream(1)
+    start = time.perf_counter()
+    games = run_headless(engine, moves, lambda e: turns.choice(DIRECTIONS))
+    elapsed = time.perf_counter() - start
+    print(f"{moves} moves, {games} games in {elapsed:.2f}s ({moves / elapsed:,.0f} moves/s)")
@@ -0,0 +1,161 @@
+"""Compact binary replays of Snake games.
+
+A replay is a small header (seed, board size, rule settings) followed by
+one record per turn: the ticks since the previous turn and the new
+direction, packed into a varint. Since the engine is deterministic, that
+is enough to play the whole game back.
+
+    python snake_replay.py FILE...     re-simulate replays headless and check their scores
+"""
+import struct
+
+from snake_engine import DIRECTIONS, Settings, SnakeEngine
+
+MAGIC = b'SNKR'
+VERSION = 4  # Bumped whenever the same seed and turns would play out differently
+HEADER = struct.Struct('<4sBQHHBB')  # magic, version, seed, width, height, flags, food count
+
+# Low 3 bits of each record: a direction index, or END_OF_GAME
+END_OF_GAME = 4
+
+def write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def read_varint(data, offset):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+class Replay:
+    def __init__(self, seed, width, height, settings, turns=None, end_tick=None, score=None):
+        self.seed = seed
+        self.width = width
+        self.height = height
+        self.settings = settings
+        self.turns = turns or []  # (tick, direction) in order
+        self.end_tick = end_tick
+        self.score = score
+
+    def to_bytes(self):
+        settings = self.settings
+        flags = settings.difficulty | (settings.special_foods << 2) | (settings.obstacles << 3)
+        out = bytearray(HEADER.pack(MAGIC, VERSION, self.seed, self.width, self.height, flags, settings.food_count))
+
+        last_tick = 0
+        for tick, direction in self.turns:
+            write_varint(out, (tick - last_tick) << 3 | DIRECTIONS.index(direction))
+            last_tick = tick
+
+        if self.end_tick is not None:
+            write_varint(out, (self.end_tick - last_tick) << 3 | END_OF_GAME)
+            write_varint(out, self.score)
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, version, seed, width, height, flags, food_count = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("not a Snake replay")
+        if version != VERSION:
+            raise ValueError(f"unsupported replay version {version}")
+
+        settings = Settings()
+        settings.difficulty = flags & 3
+        settings.special_foods = bool(flags & 4)
+        settings.obstacles = bool(flags & 8)
+        settings.food_count = food_count
+        replay = cls(seed, width, height, settings)
+
+        offset = HEADER.size
+        tick = 0
+        while offset < len(data):
+            record, offset = read_varint(data, offset)
+            tick += record >> 3
+            code = record & 7
+            if code == END_OF_GAME:
+                replay.end_tick = tick
+                replay.score, offset = read_varint(data, offset)
+                break
+            replay.turns.append((tick, DIRECTIONS[code]))
+        return replay
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls.from_bytes(f.read())
+
+# Records the turns an engine takes; attach with engine.recorder = ReplayRecorder(engine)
+# right after engine.reset()
+class ReplayRecorder:
+    def __init__(self, engine):
+        self.replay = Replay(engine.seed, engine.width, engine.height, engine.settings)
+
+    def record(self, tick, direction):
+        self.replay.turns.append((tick, direction))
+
+    def finish(self, engine):
+        self.replay.end_tick = engine.ticks
+        self.replay.score = engine.snake.score
+        return self.replay
+
+# Feeds a replay's turns back into an engine on the ticks they were taken
+class ReplayPlayer:
+    def __init__(self, replay, engine=None):
+        self.replay = replay
+        self.engine = engine or SnakeEngine(replay.settings, replay.width, replay.height)
+        self.engine.reset(replay.seed)
+        self.engine.input_source = self
+        self.next_turn = 0
+
+    def before_tick(self, engine):
+        turns = self.replay.turns
+        while self.next_turn < len(turns) and turns[self.next_turn][0] == engine.ticks:
+            engine.snake.change_direction(turns[self.next_turn][1])
+            self.next_turn += 1
+
+    @property
+    def finished(self):
+        end_tick = self.replay.end_tick
+        return not self.engine.alive or (end_tick is not None and self.engine.ticks >= end_tick)
+
+    def run(self):
+        # Play the rest of the replay as fast as possible
+        engine = self.engine
+        end_tick = self.replay.end_tick
+        while engine.alive and (end_tick is None or engine.ticks < end_tick):
+            engine.tick()
+        return engine
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    failures = 0
+    start = time.perf_counter()
+    total_ticks = 0
+    for path in sys.argv[1:]:
+        replay = Replay.load(path)
+        engine = ReplayPlayer(replay).run()
+        total_ticks += engine.ticks
+        ok = engine.snake.score == replay.score and engine.ticks == replay.end_tick
+        failures += not ok
+        status = "ok" if ok else f"MISMATCH (recorded score {replay.score} at tick {replay.end_tick})"
+        print(f"{path}: score {engine.snake.score}, {engine.ticks} ticks, {len(replay.turns)} turns - {status}")
+
+    elapsed = time.perf_counter() - start
+    if elapsed > 0:
+        print(f"{len(sys.argv) - 1} replays, {total_ticks} ticks in {elapsed:.2f}s ({total_ticks / elapsed:,.0f} ticks/s)")
+    sys.exit(1 if failures else 0)
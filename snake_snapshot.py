@@ -0,0 +1,256 @@
+"""Compact save/resume snapshots of a Snake game in progress.
+
+A snapshot is a fixed header (board size, rules, score, timers, direction,
+effect and every RNG state), one record per food, the obstacles as one bit
+per cell and the body as its head cell followed by a 2-bit direction per
+segment. A snake filling a whole 40x30 board packs into under 400 bytes.
+Taking or restoring a snapshot of a typical game takes tens of
+microseconds, and under a millisecond with the board full, so a game
+can be checkpointed every tick.
+
+Given the same input, a restored game plays on tick for tick like the game
+the snapshot was taken from. The trail drawn behind the snake is only for
+show and starts again empty.
+
+    python snake_snapshot.py [GAMES]     snapshot autopilot games every tick, check restores and time both
+"""
+import copy
+import struct
+from itertools import islice
+
+from snake_engine import DIRECTIONS, EMPTY, SNAKE_CELL, Food, RngStream, Settings, SnakeEngine
+
+MAGIC = b'SNKS'
+VERSION = 1
+# magic, version, width, height, flags, food count, direction | effect << 2, seed, ticks, moves,
+# score, grow queue, move progress, effect ticks, body length, head cell,
+# seeds, snake, food, obstacle and particle RNG states
+HEADER = struct.Struct('<4sBHHBBBQIIIIHHIIQQQQQ')
+FOOD = struct.Struct('<IB')  # cell, food type
+NO_CELL = 0xFFFFFFFF
+
+FLAG_ALIVE = 16
+FLAG_OBSTACLE_BITS = 32  # An obstacle bitset follows the foods
+EFFECTS = [None, 'speed_boost', 'slow_motion']
+FOOD_TYPES = ['normal', 'bonus', 'speed_boost', 'slow_motion']
+EFFECT_CODES = {effect: code for code, effect in enumerate(EFFECTS)}
+FOOD_CODES = {food_type: code for code, food_type in enumerate(FOOD_TYPES)}
+DIRECTION_CODES = {direction: code for code, direction in enumerate(DIRECTIONS)}
+
+# The four 2-bit codes packed in each byte value, lowest bits first
+UNPACK = [(byte & 3, byte >> 2 & 3, byte >> 4 & 3, byte >> 6) for byte in range(256)]
+
+# The last obstacle bitset packed, keyed by layout_id: obstacles rarely change
+# during a game, so snapshots taken every tick only pack them once
+_obstacle_bits = (None, b'')
+
+def step_codes(width, height):
+    # Direction code of each step from one segment to the next, keyed by the
+    # difference between their cells, including the differences across the edges
+    codes = {}
+    for code, (dx, dy) in enumerate(DIRECTIONS):
+        codes[dx - width * dx, dy - height * dy] = code
+        codes[dx, dy] = code
+    return codes
+
+def pack_codes(codes):
+    # Four 2-bit codes per byte
+    codes = codes + [0] * (-len(codes) % 4)
+    it = iter(codes)
+    return bytes(a | b << 2 | c << 4 | d << 6 for a, b, c, d in zip(it, it, it, it))
+
+def obstacle_bits(obstacles, width, height):
+    global _obstacle_bits
+    layout_id, bits = _obstacle_bits
+    if layout_id != obstacles.layout_id:
+        value = 0
+        for x, y in obstacles.obstacles:
+            value |= 1 << (x * height + y)
+        bits = value.to_bytes((width * height + 7) // 8, 'little')
+        _obstacle_bits = (obstacles.layout_id, bits)
+    return bits
+
+def snapshot(engine):
+    # The engine's game as bytes; restore() turns them back into a game
+    settings = engine.settings
+    snake = engine.snake
+    width, height = engine.width, engine.height
+    positions = snake.positions
+    head_x, head_y = positions[0]
+
+    flags = settings.difficulty | (settings.special_foods << 2) | (settings.obstacles << 3)
+    if engine.alive:
+        flags |= FLAG_ALIVE
+    if engine.obstacles.obstacles:
+        flags |= FLAG_OBSTACLE_BITS
+    out = bytearray(HEADER.pack(
+        MAGIC, VERSION, width, height, flags, len(engine.foods),
+        DIRECTION_CODES[snake.direction] | EFFECT_CODES[snake.special_effect] << 2,
+        engine.seed, engine.ticks, snake.moves, snake.score, snake.grow_queue,
+        snake.move_progress, snake.special_effect_ticks, len(positions), head_x * height + head_y,
+        engine.seeds.state, engine.rng_snake.state, engine.rng_food.state,
+        engine.rng_obstacles.state, engine.rng_particles.state))
+
+    for food in engine.foods:
+        cell = NO_CELL if food.position is None else food.position[0] * height + food.position[1]
+        out += FOOD.pack(cell, FOOD_CODES[food.food_type])
+
+    if flags & FLAG_OBSTACLE_BITS:
+        out += obstacle_bits(engine.obstacles, width, height)
+
+    codes = step_codes(width, height)
+    out += pack_codes([codes[x1 - x0, y1 - y0]
+                       for (x0, y0), (x1, y1) in zip(positions, islice(positions, 1, None))])
+    return bytes(out)
+
+def restore(data, engine=None):
+    # Rebuilds the game in data, in a new engine or in place of engine's game
+    # (keeping its clock, input source and recorder). The restored rules go in a
+    # copy of the engine's settings, so settings shared with e.g. the menu are
+    # left alone. Returns the engine.
+    (magic, version, width, height, flags, food_count, state, seed, ticks, moves, score, grow_queue,
+     move_progress, effect_ticks, length, head, seeds_state, snake_state, food_state,
+     obstacles_state, particles_state) = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("not a Snake snapshot")
+    if version != VERSION:
+        raise ValueError(f"unsupported snapshot version {version}")
+
+    # Start from an empty board: no obstacles or food to generate
+    settings = copy.copy(engine.settings) if engine is not None else Settings()
+    settings.difficulty = flags & 3
+    settings.special_foods = bool(flags & 4)
+    settings.obstacles = False
+    settings.food_count = 0
+    if engine is None:
+        engine = SnakeEngine(settings, width, height)
+    else:
+        engine.settings = settings
+        engine.width = width
+        engine.height = height
+        engine.reset()
+    settings.obstacles = bool(flags & 8)
+    settings.food_count = food_count
+
+    engine.seed = seed
+    engine.ticks = ticks
+    engine.alive = bool(flags & FLAG_ALIVE)
+    engine.seeds.state = seeds_state
+    engine.rng_snake.state = snake_state
+    engine.rng_food.state = food_state
+    engine.rng_obstacles.state = obstacles_state
+    engine.rng_particles.state = particles_state
+
+    snake = engine.snake
+    grid = snake.grid
+    for pos in snake.positions:
+        grid.set(pos, EMPTY)
+    snake.direction = DIRECTIONS[state & 3]
+    snake.special_effect = EFFECTS[state >> 2]
+    snake.special_effect_ticks = effect_ticks
+    snake.moves = moves
+    snake.score = score
+    snake.grow_queue = grow_queue
+    snake.move_progress = move_progress
+
+    offset = HEADER.size
+    food_cells = []
+    for _ in range(food_count):
+        food_cells.append(FOOD.unpack_from(data, offset))
+        offset += FOOD.size
+
+    if flags & FLAG_OBSTACLE_BITS:
+        size = (width * height + 7) // 8
+        cells = []
+        for index, byte in enumerate(data[offset:offset + size]):
+            while byte:
+                low = byte & -byte
+                cells.append(divmod(index * 8 + low.bit_length() - 1, height))
+                byte ^= low
+        engine.obstacles.place_obstacles(cells)
+        offset += size
+
+    # Walk the body from the head, one 2-bit step per segment
+    x, y = divmod(head, height)
+    positions = [(x, y)]
+    steps = [code for byte in data[offset:offset + (length + 2) // 4] for code in UNPACK[byte]]
+    for code in islice(steps, length - 1):
+        dx, dy = DIRECTIONS[code]
+        x = (x + dx) % width
+        y = (y + dy) % height
+        positions.append((x, y))
+    snake.positions.clear()
+    snake.positions.extend(positions)
+    grid.set_many(positions, SNAKE_CELL)
+    entered = snake.entered
+    for place, (x, y) in enumerate(positions):
+        entered[x][y] = moves - place
+
+    # New food lands on a random free cell, which place() moves to the saved one
+    engine.foods = []
+    for cell, food_type in food_cells:
+        food = Food(grid, settings, RngStream(0))
+        food.place(None if cell == NO_CELL else divmod(cell, height), FOOD_TYPES[food_type])
+        food.rng = engine.rng_food
+        engine.foods.append(food)
+    return engine
+
+def save(engine, path):
+    with open(path, 'wb') as f:
+        f.write(snapshot(engine))
+
+def load(path, engine=None):
+    with open(path, 'rb') as f:
+        return restore(f.read(), engine)
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    from snake_autopilot import AStarAutopilot
+
+    CHECK_EVERY = 500  # Ticks between full restore checks
+    CHECK_TICKS = 300  # Ticks a restored game must then play exactly like the original
+
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    engine = SnakeEngine(Settings(), seed=0)
+    engine.input_source = AStarAutopilot()
+    failures = 0
+    count = total_bytes = largest = 0
+    snapshot_time = restore_time = 0.0
+    for game in range(games):
+        engine.reset()
+        check = None  # (restored engine, tick to compare it with the original on)
+        while engine.alive and engine.ticks < 50000:
+            if check:
+                check[0].tick()
+            engine.tick()
+            if check and (engine.ticks == check[1] or not engine.alive):
+                if snapshot(check[0]) != snapshot(engine):
+                    failures += 1
+                    print(f"game {game}, tick {engine.ticks}: restored game went its own way")
+                check = None
+
+            start = time.perf_counter()
+            data = snapshot(engine)
+            middle = time.perf_counter()
+            restored = restore(data)
+            snapshot_time += middle - start
+            restore_time += time.perf_counter() - middle
+            count += 1
+            total_bytes += len(data)
+            largest = max(largest, len(data))
+
+            if engine.ticks % CHECK_EVERY == 0 and not check:
+                if snapshot(restored) != data:
+                    failures += 1
+                    print(f"game {game}, tick {engine.ticks}: restore MISMATCH")
+                # Both go on with new autopilots, which start out with the same plans
+                engine.input_source = AStarAutopilot()
+                restored.input_source = AStarAutopilot()
+                check = restored, engine.ticks + CHECK_TICKS
+        print(f"game {game}: score {engine.snake.score}, length {len(engine.snake.positions)}, {engine.ticks} ticks")
+
+    print(f"{count} snapshots, {total_bytes / count:.0f} bytes on average, {largest} at most; "
+          f"{snapshot_time / count * 1e6:.1f} us to take, {restore_time / count * 1e6:.1f} us to restore")
+    sys.exit(1 if failures else 0)
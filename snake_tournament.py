@@ -0,0 +1,166 @@
+"""Tournaments between Snake autopilots, played headless on a process pool.
+
+Every policy plays the same seeded games at each difficulty. Games go to the
+workers in chunks, and each chunk's results come back as soon as it is done
+and are folded into running totals, so memory stays flat however many games
+are played.
+
+    python snake_tournament.py [--games N] [--policies astar cycle] [--difficulties 0 1 2]
+                               [--workers N] [--chunk N] [--board WxH] [--max-ticks N] [--csv FILE]
+"""
+import argparse
+import csv
+import multiprocessing
+import os
+import queue
+import sys
+import time
+
+from snake_autopilot import POLICIES
+from snake_engine import GRID_HEIGHT, GRID_WIDTH, RngStream, Settings, SnakeEngine, board_size
+
+CHUNK_SIZE = 20  # Games per work item
+IN_FLIGHT = 4  # Work items queued per worker; more are only handed out as results come back
+MAX_TICKS = 100000  # Games still going after this many ticks end as 'timeout'
+DIFFICULTY_NAMES = ["Easy", "Medium", "Hard"]
+DEATH_CAUSES = ['self', 'obstacle', 'timeout']
+
+def game_seed(seed, game):
+    # The seed of game number `game`, the same for every policy and difficulty
+    return RngStream(seed, game).getrandbits(64)
+
+def play_chunk(task):
+    # Worker: play games first..first+count-1 with one policy at one difficulty.
+    # Returns the task's key and (seed, score, length, ticks, death cause) per game.
+    policy, difficulty, seed, first, count, width, height, max_ticks = task
+    settings = Settings()
+    settings.difficulty = difficulty
+    engine = SnakeEngine(settings, width, height)
+    autopilot = POLICIES[policy]()
+    engine.input_source = autopilot
+
+    games = []
+    for game in range(first, first + count):
+        engine.reset(game_seed(seed, game))
+        # Check for the end every move rather than every tick
+        while engine.alive and engine.ticks < max_ticks:
+            engine.step()
+        snake = engine.snake
+        cause = snake.death_cause if not engine.alive else 'timeout'
+        games.append((engine.seed, snake.score, len(snake.positions), engine.ticks, cause))
+    return (policy, difficulty), games
+
+def tasks(policies, difficulties, games, seed, chunk, width, height, max_ticks):
+    for first in range(0, games, chunk):
+        count = min(chunk, games - first)
+        for difficulty in difficulties:
+            for policy in policies:
+                yield policy, difficulty, seed, first, count, width, height, max_ticks
+
+def stream(pool, work, in_flight):
+    # Results of play_chunk over work, in the order they finish. At most
+    # in_flight items are handed to the pool at once, so neither the work
+    # queue nor the results pile up.
+    results = queue.Queue()
+    pending = 0
+    for task in work:
+        pool.apply_async(play_chunk, (task,), callback=results.put, error_callback=results.put)
+        pending += 1
+        while pending >= in_flight:
+            yield finished(results.get())
+            pending -= 1
+    while pending:
+        yield finished(results.get())
+        pending -= 1
+
+def finished(result):
+    if isinstance(result, BaseException):
+        raise result
+    return result
+
+class Summary:
+    # Running totals for one policy at one difficulty
+    def __init__(self):
+        self.games = 0
+        self.score = 0
+        self.best = 0
+        self.length = 0
+        self.ticks = 0
+        self.causes = dict.fromkeys(DEATH_CAUSES, 0)
+
+    def add(self, score, length, ticks, cause):
+        self.games += 1
+        self.score += score
+        self.best = max(self.best, score)
+        self.length += length
+        self.ticks += ticks
+        self.causes[cause] += 1
+
+def run(policies, difficulties, games, seed=0, workers=None, chunk=CHUNK_SIZE,
+        width=GRID_WIDTH, height=GRID_HEIGHT, max_ticks=MAX_TICKS, csv_file=None, progress=True):
+    # Returns {(policy, difficulty): Summary}
+    summaries = {(policy, difficulty): Summary() for difficulty in difficulties for policy in policies}
+    writer = None
+    if csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(['policy', 'difficulty', 'seed', 'score', 'length', 'ticks', 'death_cause'])
+
+    total = games * len(policies) * len(difficulties)
+    done = 0
+    start = time.perf_counter()
+    work = tasks(policies, difficulties, games, seed, chunk, width, height, max_ticks)
+    workers = workers or os.cpu_count()
+    with multiprocessing.Pool(workers) as pool:
+        for key, results in stream(pool, work, workers * IN_FLIGHT):
+            summary = summaries[key]
+            for seed_, score, length, ticks, cause in results:
+                summary.add(score, length, ticks, cause)
+                if writer:
+                    writer.writerow([key[0], key[1], seed_, score, length, ticks, cause])
+            done += len(results)
+            if progress:
+                elapsed = time.perf_counter() - start
+                print(f"\r{done}/{total} games, {done / elapsed:,.1f} games/s", end='', file=sys.stderr, flush=True)
+    if progress:
+        print(file=sys.stderr)
+    return summaries
+
+def report(summaries):
+    print(f"{'policy':<8} {'difficulty':<10} {'games':>8} {'score':>8} {'best':>6} {'length':>8} {'ticks':>9}  deaths")
+    for (policy, difficulty), s in summaries.items():
+        if not s.games:
+            continue
+        deaths = ", ".join(f"{cause} {count / s.games:.0%}" for cause, count in s.causes.items() if count)
+        print(f"{policy:<8} {DIFFICULTY_NAMES[difficulty]:<10} {s.games:>8} {s.score / s.games:>8.1f} {s.best:>6} "
+              f"{s.length / s.games:>8.1f} {s.ticks / s.games:>9.0f}  {deaths}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Snake autopilot tournament")
+    parser.add_argument('--games', type=int, default=100, help="games per policy and difficulty")
+    parser.add_argument('--policies', nargs='+', choices=sorted(POLICIES), default=sorted(POLICIES))
+    parser.add_argument('--difficulties', nargs='+', type=int, choices=range(3), default=[0, 1, 2])
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument('--chunk', type=int, default=CHUNK_SIZE, help="games per work item")
+    parser.add_argument('--board', type=board_size, default=(GRID_WIDTH, GRID_HEIGHT), help="WIDTHxHEIGHT")
+    parser.add_argument('--max-ticks', type=int, default=MAX_TICKS, help="ticks before a game counts as a timeout")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--csv', help="also write one row per game to this file")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    csv_file = open(args.csv, 'w', newline='') if args.csv else None
+    try:
+        summaries = run(args.policies, args.difficulties, args.games, args.seed, args.workers, args.chunk,
+                        *args.board, args.max_ticks, csv_file)
+    finally:
+        if csv_file:
+            csv_file.close()
+    elapsed = time.perf_counter() - start
+
+    report(summaries)
+    games = sum(s.games for s in summaries.values())
+    print(f"{games} games in {elapsed:.1f}s on {args.workers} workers ({games / elapsed:,.1f} games/s)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())